@@ -0,0 +1,95 @@
+""" Benchmark the removal of rejected labels in dotblotr.image.find_spots
+on a synthetic noisy strip.
+
+usage: python benchmarks/bench_find_spots.py [--n_debris N] [--repeats N]
+"""
+import argparse
+import timeit
+
+import cv2
+import numpy as np
+from skimage.measure import label
+
+from dotblotr.image.find_spots import _keep_labels, find_spots
+
+SPOT_PARAMS = {
+    'med_filt_size': 7,
+    'block_size': 101,
+    'closing_size': 11,
+    'erosion_size': 10,
+    'min_area': 100,
+    'circ_thresh': 0.3
+}
+
+
+def make_noisy_strip(
+        n_rows: int = 16,
+        n_cols: int = 24,
+        pitch: int = 50,
+        dot_size: int = 20,
+        n_debris: int = 5000,
+        seed: int = 0
+) -> np.ndarray:
+    """ Make a single channel strip image with a grid of dots and small debris blobs """
+    rng = np.random.RandomState(seed)
+    im_height = (n_rows + 1) * pitch
+    im_width = (n_cols + 1) * pitch
+    im = rng.randint(0, 10, size=(im_height, im_width)).astype('uint8')
+
+    for r in range(n_rows):
+        for c in range(n_cols):
+            center = (pitch * (c + 1), pitch * (r + 1))
+            cv2.circle(im, center, dot_size, int(rng.randint(90, 110)), cv2.FILLED)
+
+    debris_x = rng.randint(0, im_width, size=n_debris)
+    debris_y = rng.randint(0, im_height, size=n_debris)
+    for x, y in zip(debris_x, debris_y):
+        cv2.circle(im, (int(x), int(y)), int(rng.randint(1, 3)), 100, cv2.FILLED)
+
+    return im
+
+
+def _remove_labels_loop(label_image: np.ndarray, good_labels) -> np.ndarray:
+    """ The previous per-label implementation, for comparison """
+    label_image = label_image.copy()
+    unique_labels = np.unique(label_image)
+    in_good_labels = np.isin(unique_labels, good_labels)
+    labels_to_remove = unique_labels[np.logical_not(in_good_labels)]
+
+    for l in labels_to_remove:
+        label_image[label_image == l] = 0
+
+    return label_image
+
+
+def main(n_debris: int, repeats: int):
+    im = make_noisy_strip(n_debris=n_debris)
+
+    # label the unfiltered image so that the debris blobs are all rejected
+    label_image = label(im > 50)
+    areas = np.bincount(label_image.ravel())
+    good_labels = np.flatnonzero(areas > SPOT_PARAMS['min_area'])
+    good_labels = good_labels[good_labels > 0]
+    n_labels = label_image.max()
+    print('image shape: {}, labels: {}, kept: {}'.format(im.shape, n_labels, len(good_labels)))
+
+    loop_result = _remove_labels_loop(label_image, good_labels)
+    lut_result = _keep_labels(label_image, good_labels)
+    assert np.array_equal(loop_result, lut_result)
+
+    t_loop = min(timeit.repeat(lambda: _remove_labels_loop(label_image, good_labels), number=1, repeat=repeats))
+    t_lut = min(timeit.repeat(lambda: _keep_labels(label_image, good_labels), number=1, repeat=repeats))
+    print('per-label loop: {:.4f} s'.format(t_loop))
+    print('lookup table:   {:.4f} s'.format(t_lut))
+    print('speedup:        {:.1f}x'.format(t_loop / t_lut))
+
+    t_find_spots = min(timeit.repeat(lambda: find_spots(im, spot_params=SPOT_PARAMS), number=1, repeat=repeats))
+    print('find_spots:     {:.4f} s'.format(t_find_spots))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n_debris', type=int, default=5000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    main(n_debris=args.n_debris, repeats=args.repeats)
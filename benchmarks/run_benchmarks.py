@@ -0,0 +1,219 @@
+""" Benchmark the dotblotr pipeline on simulated strips at several scales.
+
+Every combination of layout, pitch, image size, noise, debris level and number of
+strips is a benchmark case. The image size is given as a multiple of the size that
+fits the array with a one pitch margin (the dots stay in the top left corner).
+For each case, n_strips simulated strips are written to a temporary directory and
+each function is timed. The results are saved to <output_dir>/<commit>.csv so that
+runs on different commits can be compared with --compare. The default output_dir
+is ignored by git.
+
+usage: python benchmarks/run_benchmarks.py [--layouts 96 384 1536] [--pitch 50]
+    [--im_scale 1] [--noise 0] [--n_debris 0] [--n_strips 4] [--n_workers 1] [--repeats 3]
+    [--functions find_spots ...] [--output_dir benchmarks/results] [--compare OTHER.csv]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import subprocess
+import tempfile
+import timeit
+import warnings
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+import pandas as pd
+from skimage import io
+
+from dotblotr.analysis import calc_hit_counts
+from dotblotr.image import find_spots, get_intensities, quantify_blot_array
+from dotblotr.process import process_im_list
+from dotblotr.test.utils import PLATE_LAYOUTS, make_array_config, make_assay_config, make_strip_image
+from dotblotr.viz import plot_cplot, plot_detected_dots, plot_hit_grid
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+CASE_COLS = ['layout', 'pitch', 'im_scale', 'noise', 'n_debris', 'n_strips', 'n_workers']
+
+
+def _git_commit() -> str:
+    """ Get the short hash of the checked out commit, marked -dirty if there are changes """
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty', '--exclude', '*'],
+            cwd=BENCHMARK_DIR, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def make_case(
+        case_dir: str, layout: int, pitch: int, im_scale: float, noise: float, n_debris: int, n_strips: int
+) -> dict:
+    """ Write the configs and strip images for a benchmark case to case_dir """
+    n_rows, n_cols = PLATE_LAYOUTS[layout]
+    array_config = make_array_config(n_rows, n_cols, pitch=pitch)
+    assay_config = make_assay_config(array_config)
+    im_shape = (int(im_scale * pitch * (n_rows + 1)), int(im_scale * pitch * (n_cols + 1)))
+
+    array_config_path = os.path.join(case_dir, 'array_config.json')
+    with open(array_config_path, 'w') as f:
+        json.dump(array_config, f)
+    assay_config_path = os.path.join(case_dir, 'assay_config.csv')
+    assay_config.to_csv(assay_config_path, index=False)
+
+    strip_ids = ['strip_{}'.format(i) for i in range(n_strips)]
+    im_paths = [os.path.join(case_dir, strip_id + '.tif') for strip_id in strip_ids]
+    for seed, im_path in enumerate(im_paths):
+        im = make_strip_image(
+            array_config, assay_config, im_shape=im_shape, noise=noise, n_debris=n_debris, seed=seed
+        )
+        io.imsave(im_path, im, check_contrast=False)
+
+    return {
+        'case_dir': case_dir,
+        'array_config': array_config,
+        'array_config_path': array_config_path,
+        'assay_config_path': assay_config_path,
+        'im_paths': im_paths,
+        'strip_ids': strip_ids
+    }
+
+
+def make_benchmarks(case: dict, n_workers: int) -> dict:
+    """ Make the functions to time for a benchmark case """
+    control_im = io.imread(case['im_paths'][0])[..., 0]
+    spot_params = case['array_config']['spot_params']
+
+    def _process_im_list():
+        return process_im_list(
+            case['im_paths'], case['strip_ids'], case['array_config_path'], case['assay_config_path'],
+            n_workers=n_workers
+        )
+
+    results_table = _process_im_list()
+    hit_table = calc_hit_counts(results_table)
+    hits = results_table.loc[results_table['pos_hit']]
+
+    def _plot(plot_func, *args, **kwargs):
+        def _run():
+            plot_func(*args, **kwargs)
+            plt.close('all')
+        return _run
+
+    benchmarks = {
+        'find_spots': lambda: find_spots(control_im, spot_params=spot_params),
+        'get_intensities': lambda: get_intensities(control_im, case['array_config_path']),
+        'quantify_blot_array': lambda: quantify_blot_array(
+            case['im_paths'][0], case['strip_ids'][0], case['array_config_path'], case['assay_config_path']
+        ),
+        'process_im_list': _process_im_list,
+        'calc_hit_counts': lambda: calc_hit_counts(results_table),
+        'plot_hit_grid': lambda: _plot(plot_hit_grid, hit_table.copy(), results_table)(),
+        'plot_cplot': _plot(
+            plot_cplot, hits, vertical_var='dot_name', color_var='norm_probe_intensity'
+        ),
+        'plot_detected_dots': _plot(
+            plot_detected_dots, results_table, case['strip_ids'][0], case['case_dir']
+        )
+    }
+
+    return benchmarks
+
+
+def run_benchmarks(
+        layouts, pitches, im_scales, noises, n_debris_levels, n_strips_levels, n_workers, repeats, functions
+) -> pd.DataFrame:
+    commit = _git_commit()
+    date = datetime.datetime.now().isoformat(timespec='seconds')
+
+    rows = []
+    cases = itertools.product(layouts, pitches, im_scales, noises, n_debris_levels, n_strips_levels)
+    for layout, pitch, im_scale, noise, n_debris, n_strips in cases:
+        with tempfile.TemporaryDirectory() as case_dir:
+            case = make_case(case_dir, layout, pitch, im_scale, noise, n_debris, n_strips)
+            benchmarks = make_benchmarks(case, n_workers)
+
+            for function in functions:
+                times = timeit.repeat(benchmarks[function], number=1, repeat=repeats)
+                row = {
+                    'commit': commit,
+                    'date': date,
+                    'layout': layout,
+                    'pitch': pitch,
+                    'im_scale': im_scale,
+                    'noise': noise,
+                    'n_debris': n_debris,
+                    'n_strips': n_strips,
+                    'n_workers': n_workers,
+                    'function': function,
+                    'best': min(times),
+                    'median': pd.Series(times).median()
+                }
+                print('{layout} wells, pitch {pitch}, image scale {im_scale}, noise {noise}, '
+                      'debris {n_debris}, {n_strips} strips: {function} {best:.4f} s'.format(**row))
+                rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def compare_results(results: pd.DataFrame, other_results: pd.DataFrame) -> pd.DataFrame:
+    """ Compare the best times with those of another run. ratio > 1 means this run is slower. """
+    key_cols = CASE_COLS + ['function']
+    comparison = results.merge(other_results, on=key_cols, suffixes=('', '_other'))
+    comparison['ratio'] = comparison['best'] / comparison['best_other']
+
+    return comparison[key_cols + ['best', 'best_other', 'ratio']]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--layouts', type=int, nargs='+', default=[96, 384, 1536], choices=sorted(PLATE_LAYOUTS))
+    parser.add_argument('--pitch', type=int, nargs='+', default=[50], help='dot pitch in pixels')
+    parser.add_argument(
+        '--im_scale', type=float, nargs='+', default=[1],
+        help='image size as a multiple of the size that fits the array'
+    )
+    parser.add_argument('--noise', type=float, nargs='+', default=[0], help='std of the Gaussian noise')
+    parser.add_argument('--n_debris', type=int, nargs='+', default=[0], help='number of debris blobs')
+    parser.add_argument('--n_strips', type=int, nargs='+', default=[4])
+    parser.add_argument('--n_workers', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--functions', nargs='+', default=None, help='functions to time (default all)')
+    parser.add_argument('--output_dir', default=os.path.join(BENCHMARK_DIR, 'results'))
+    parser.add_argument('--compare', default=None, help='results CSV of another run to compare with')
+    args = parser.parse_args()
+
+    all_functions = [
+        'find_spots', 'get_intensities', 'quantify_blot_array', 'process_im_list',
+        'calc_hit_counts', 'plot_hit_grid', 'plot_cplot', 'plot_detected_dots'
+    ]
+    functions = all_functions if args.functions is None else args.functions
+    unknown_functions = set(functions) - set(all_functions)
+    if unknown_functions:
+        parser.error('unknown functions: {}'.format(', '.join(sorted(unknown_functions))))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = run_benchmarks(
+            args.layouts, args.pitch, args.im_scale, args.noise, args.n_debris, args.n_strips,
+            args.n_workers, args.repeats, functions
+        )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, '{}.csv'.format(results['commit'].iloc[0]))
+    results.to_csv(output_path, index=False)
+    print('saved results to {}'.format(output_path))
+
+    if args.compare is not None:
+        comparison = compare_results(results, pd.read_csv(args.compare))
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(comparison.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
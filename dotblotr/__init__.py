@@ -1,2 +1,3 @@
-from .blot_config import BlotConfig
+from .blot_config import BlotConfig, load_blot_config
 from .blot_data import BlotData
+from .profiling import StageProfiler
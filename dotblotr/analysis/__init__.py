@@ -1 +1,2 @@
+from .hit_calling import call_hits
 from .hit_counts import calc_hit_counts
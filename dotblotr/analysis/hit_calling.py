@@ -0,0 +1,50 @@
+from typing import Union
+
+import pandas as pd
+
+STRIP_GROUP_COLS = ['assay_id', 'strip_id', 'channel']
+NEG_CONTROL_GROUP = 'neg'
+
+
+def call_hits(results_table: pd.DataFrame, zscore_threshold: Union[None, float] = None) -> pd.DataFrame:
+    """ Normalize the probe intensities and call the positive hits for all strips at once.
+    The positive threshold of each strip (and probe channel) is the mean of its normalized negative
+    control intensities plus zscore_threshold standard deviations.
+
+    Parameters
+    ----------
+    results_table : pd.DataFrame
+        Results table with the mean_intensity_control and mean_intensity_probe of each dot,
+        e.g., from process_dir() or quantify_blot_array() with hit_calling=False.
+        Results that already have hits called are re-thresholded.
+    zscore_threshold : Union[None, float]
+        Number of negative control standard deviations above the negative control
+        mean for a dot to be a positive hit. If None, the zscore_threshold column
+        from the assay config is used.
+
+    Returns
+    -------
+    results_table : pd.DataFrame
+        A copy of the results table with the norm_probe_intensity, positive_threshold
+        and pos_hit columns.
+    """
+    results_table = results_table.copy()
+    group_cols = [results_table[c] for c in STRIP_GROUP_COLS if c in results_table.columns]
+
+    norm_intensities = results_table['mean_intensity_probe'] / results_table['mean_intensity_control']
+
+    # calculate the negative control statistics for every strip in one groupby
+    neg_intensities = norm_intensities.where(results_table['exp_group'] == NEG_CONTROL_GROUP)
+    neg_stats = neg_intensities.groupby(group_cols, sort=False, observed=True)
+    neg_mean = neg_stats.transform('mean')
+    neg_std = neg_stats.transform('std')
+
+    if zscore_threshold is None:
+        zscore_threshold = results_table['zscore_threshold']
+    thresholds = neg_mean + zscore_threshold * neg_std
+
+    results_table['norm_probe_intensity'] = norm_intensities
+    results_table['positive_threshold'] = thresholds
+    results_table['pos_hit'] = norm_intensities > thresholds
+
+    return results_table
@@ -14,31 +14,39 @@ SPOT_DATA_COLS = [
     'col'
 ]
 
-def calc_hit_counts(results_table:pd.DataFrame, aux_columns:Union[None, List[str]] = None):
-    assays = results_table.assay_id.unique()
-
-    hit_dfs = []
-    for assay in assays:
-        # get the positive results for the assay
-        assay_results = results_table.loc[results_table['assay_id'] == assay]
-        pos_hits = assay_results.loc[assay_results['pos_hit']]
-        hit_counts = pos_hits['dot_name'].value_counts()
-        hit_counts_df = pd.DataFrame({'dot_name': hit_counts.index.values, 'n_hits': hit_counts.values})
-
-        # add the dots with 0 hits
-        neg_dots = assay_results.loc[assay_results['pos_hit'] == False]
-        no_hit_dot_names = neg_dots[~neg_dots.dot_name.isin(pos_hits.dot_name)]['dot_name'].unique()
-        neg_dots_df = pd.DataFrame({'dot_name': no_hit_dot_names, 'n_hits': 0})
-        hit_counts_df = pd.concat([hit_counts_df, neg_dots_df], ignore_index=True)
-
-        # get data about the positive spots
-        if aux_columns is not None:
-            cols_to_transfer = SPOT_DATA_COLS + aux_columns
-        else:
-            cols_to_transfer = SPOT_DATA_COLS
-        hit_spot_data = assay_results[cols_to_transfer].drop_duplicates()
-
-        result = hit_spot_data.join(hit_counts_df.set_index('dot_name'), on='dot_name')
-        hit_dfs.append(result)
-
-        return hit_dfs
+def calc_hit_counts(results_table:pd.DataFrame, aux_columns:Union[None, List[str]] = None) -> pd.DataFrame:
+    """ Count the number of strips each dot was a positive hit in, for all assays at once.
+
+    Parameters
+    ----------
+    results_table : pd.DataFrame
+        The results table output from process_dir()
+    aux_columns : Union[None, List[str]]
+        Additional results_table columns describing the dots to include in the hit table.
+
+    Returns
+    -------
+    hit_table : pd.DataFrame
+        Table with the spot data and n_hits for every dot in every assay
+        (and probe channel, if the results have a channel column),
+        including the dots with 0 hits.
+    """
+    group_cols = ['assay_id', 'dot_name']
+    if 'channel' in results_table.columns:
+        group_cols.insert(1, 'channel')
+
+    # count the positive hits for every dot, including those with no hits
+    n_hits = results_table.groupby(group_cols, sort=False, observed=True)['pos_hit'].sum()
+    n_hits = n_hits.astype(int).rename('n_hits')
+
+    # get data about the spots
+    if aux_columns is not None:
+        cols_to_transfer = SPOT_DATA_COLS + aux_columns
+    else:
+        cols_to_transfer = SPOT_DATA_COLS
+    cols_to_transfer = cols_to_transfer + [c for c in group_cols if c not in cols_to_transfer]
+    hit_spot_data = results_table[cols_to_transfer].drop_duplicates()
+
+    hit_table = hit_spot_data.join(n_hits, on=group_cols)
+
+    return hit_table
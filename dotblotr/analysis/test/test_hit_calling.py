@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from dotblotr.analysis import call_hits
+
+
+def test_call_hits():
+    results_table = pd.DataFrame({
+        'assay_id': ['assay_1'] * 8,
+        'strip_id': ['strip_1'] * 4 + ['strip_2'] * 4,
+        'dot_name': ['A1', 'A2', 'A3', 'A4'] * 2,
+        'exp_group': ['neg', 'neg', 'exp', 'exp'] * 2,
+        'zscore_threshold': [3] * 8,
+        'mean_intensity_control': [10.] * 8,
+        'mean_intensity_probe': [1., 3., 1.5, 10., 5., 7., 12., 5.5]
+    })
+
+    hit_table = call_hits(results_table)
+
+    # the thresholds are calculated per strip
+    neg_1 = np.array([0.1, 0.3])
+    neg_2 = np.array([0.5, 0.7])
+    expected_thresholds = [neg_1.mean() + 3 * neg_1.std(ddof=1)] * 4 + [neg_2.mean() + 3 * neg_2.std(ddof=1)] * 4
+    np.testing.assert_allclose(hit_table['positive_threshold'], expected_thresholds)
+    np.testing.assert_array_equal(
+        hit_table['pos_hit'], [False, False, False, True, False, False, True, False]
+    )
+    assert 'pos_hit' not in results_table.columns
+
+    # re-threshold without touching the intensities
+    rethresholded = call_hits(hit_table, zscore_threshold=0)
+    np.testing.assert_allclose(rethresholded['positive_threshold'], [0.2] * 4 + [0.6] * 4)
+    np.testing.assert_array_equal(
+        rethresholded['pos_hit'], [False, True, False, True, False, True, True, False]
+    )
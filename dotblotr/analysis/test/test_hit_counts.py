@@ -0,0 +1,30 @@
+import pandas as pd
+
+from dotblotr.analysis import calc_hit_counts
+
+
+def test_calc_hit_counts():
+    spot_data = {
+        'source_plate_id': 'plate_1',
+        'source_plate_row': 'A',
+        'source_plate_column': 1,
+        'exp_group': 'exp',
+    }
+    results_table = pd.DataFrame({
+        'assay_id': ['assay_1'] * 4 + ['assay_2'] * 4,
+        'strip_id': ['strip_1', 'strip_1', 'strip_2', 'strip_2'] * 2,
+        'dot_name': ['A1', 'A2'] * 4,
+        'row': [0, 0] * 4,
+        'col': [0, 1] * 4,
+        'pos_hit': [True, False, True, False, False, False, True, True],
+        **spot_data
+    })
+
+    hit_table = calc_hit_counts(results_table)
+
+    n_hits = hit_table.set_index(['assay_id', 'dot_name'])['n_hits']
+    assert len(hit_table) == 4
+    assert n_hits[('assay_1', 'A1')] == 2
+    assert n_hits[('assay_1', 'A2')] == 0
+    assert n_hits[('assay_2', 'A1')] == 1
+    assert n_hits[('assay_2', 'A2')] == 1
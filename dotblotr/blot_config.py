@@ -1,8 +1,35 @@
+from functools import lru_cache
 import json
+import os
 from typing import Union, Dict
 
 
+def downsample_factor(spot_params: Dict) -> int:
+    """Get the downsample factor from spot_params (1 if not set).
+    Raises a ValueError if it is not a positive integer."""
+    downsample = spot_params.get('downsample', 1)
+    if isinstance(downsample, float) and downsample.is_integer():
+        downsample = int(downsample)
+    if not isinstance(downsample, int) or isinstance(downsample, bool) or downsample < 1:
+        raise ValueError('downsample in spot_params must be a positive integer, got {}'.format(downsample))
+
+    return downsample
+
+
 class BlotConfig:
+    """The array config of a strip, loaded from a JSON file or a dictionary.
+
+    Required keys: name, n_rows, n_cols, row_labels, col_labels, row_pitch,
+    col_pitch and spot_params (med_filt_size, block_size, closing_size,
+    erosion_size, min_area and circ_thresh, plus the optional downsample factor).
+
+    Optional keys:
+    - pixel_size: the size of an image pixel in the units of row_pitch and col_pitch,
+      e.g., 0.09 for a 4.5 mm pitch imaged at 0.09 mm per pixel. Required by
+      detection_method 'fixed_grid' and by grid_method 'lattice' to fit the pitch.
+    - detection_method: 'segment' (default) or 'fixed_grid'
+    - grid_method: 'kmeans' (default) or 'lattice'
+    """
 
     def __init__(self, config: Union[Dict, str]):
         if isinstance(config, str):
@@ -10,6 +37,8 @@ class BlotConfig:
                 self.config = json.load(read_file)
         else:
             self.config = config
+        if 'spot_params' in self.config:
+            downsample_factor(self.config['spot_params'])
     @property
     def spot_params(self):
         return self.config['spot_params']
@@ -30,6 +59,32 @@ class BlotConfig:
     def n_rows(self, n_rows:int):
         self.config['n_rows'] = n_cols
 
+    @property
+    def row_pitch(self) -> float:
+        return self.config['row_pitch']
+
+    @property
+    def col_pitch(self) -> float:
+        return self.config['col_pitch']
+
+    @property
+    def pixel_size(self) -> Union[None, float]:
+        """The size of an image pixel in the units of row_pitch and col_pitch.
+        None if not set in the config."""
+        return self.config.get('pixel_size', None)
+
+    @property
+    def detection_method(self) -> str:
+        """The method used to find the spots.
+        Either 'segment' (default) or 'fixed_grid'."""
+        return self.config.get('detection_method', 'segment')
+
+    @property
+    def grid_method(self) -> str:
+        """The method used to assign spots to grid positions.
+        Either 'kmeans' (default) or 'lattice'."""
+        return self.config.get('grid_method', 'kmeans')
+
     def get_col_label(self, col_index:int)->str:
 
         col_label = self.config['col_labels'][col_index]
@@ -41,3 +96,32 @@ class BlotConfig:
         col_label = self.config['row_labels'][row_index]
 
         return col_label
+
+
+@lru_cache(maxsize=32)
+def _load_blot_config(config_path: str, mtime: float) -> BlotConfig:
+    return BlotConfig(config=config_path)
+
+
+def load_blot_config(config: Union[BlotConfig, Dict, str]) -> BlotConfig:
+    """ Get a BlotConfig, parsing each config file at most once per process.
+
+    Parameters
+    ----------
+    config : Union[BlotConfig, Dict, str]
+        A loaded BlotConfig (returned as is), a config dictionary or
+        the path to the array config JSON.
+
+    Returns
+    -------
+    blot_config : BlotConfig
+        The array config. Configs loaded from the same unmodified file
+        are the same object.
+    """
+    if isinstance(config, BlotConfig):
+        return config
+    elif isinstance(config, str):
+        config_path = os.path.abspath(config)
+        return _load_blot_config(config_path, os.path.getmtime(config_path))
+    else:
+        return BlotConfig(config=config)
@@ -1,4 +1,5 @@
 from typing import Dict, Union
+import zlib
 
 import numpy as np
 import pandas as pd
@@ -19,3 +20,41 @@ class BlotData:
         self.label_mapping = label_mapping
         self.grid_coords = grid_coords
         self.mask_raw_im = mask_raw_im
+
+    @property
+    def label_im(self) -> Union[None, np.ndarray]:
+        if self._compressed_label_im is not None:
+            data, dtype, shape = self._compressed_label_im
+            return np.frombuffer(zlib.decompress(data), dtype=dtype).reshape(shape)
+
+        return self._label_im
+
+    @label_im.setter
+    def label_im(self, label_im: Union[None, np.ndarray]):
+        self._label_im = label_im
+        self._compressed_label_im = None
+
+    def release_images(self, labels: str = 'compress'):
+        """ Drop the raw images once the blot has been measured to free memory.
+
+        Parameters
+        ----------
+        labels : str
+            What to do with the label image. 'keep' leaves it as is,
+            'compress' stores it zlib compressed and decompresses it (read only)
+            each time label_im is accessed, and 'drop' removes it.
+            Default value is 'compress'.
+        """
+        self.raw_im = None
+        self.mask_raw_im = None
+
+        if labels == 'compress':
+            label_im = self.label_im
+            if label_im is not None:
+                compressed = zlib.compress(np.ascontiguousarray(label_im).tobytes())
+                self._label_im = None
+                self._compressed_label_im = (compressed, label_im.dtype, label_im.shape)
+        elif labels == 'drop':
+            self.label_im = None
+        elif labels != 'keep':
+            raise ValueError('labels must be keep, compress or drop, got {}'.format(labels))
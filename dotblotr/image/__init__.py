@@ -1,3 +1,7 @@
-from .find_spots import get_intensities, find_spots, get_intensities_from_mask
-from .io import open_rgb
-from .quantify_spots import quantify_blot_array
+from .find_spots import (
+    get_intensities, find_spots, get_intensities_from_mask, get_multichannel_intensities_from_mask
+)
+from .fixed_grid import get_grid_intensities
+from .io import open_rgb, open_channels
+from .quantify_spots import quantify_blot_array, load_assay_config
+from .mask_store import MaskStore
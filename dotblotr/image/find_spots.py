@@ -1,39 +1,51 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Union
+import warnings
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import binary_dilation, binary_erosion, distance_transform_edt
 from skimage import io
 from skimage.filters import threshold_otsu, median
-from skimage.measure import label, regionprops
+from skimage.measure import label, regionprops, regionprops_table
 from skimage.morphology import closing, square, disk, erosion
 from skimage.segmentation import clear_border
+from skimage.transform import downscale_local_mean
 from sklearn.cluster import KMeans
 
-from dotblotr import BlotConfig
+from dotblotr import BlotConfig, load_blot_config
+from dotblotr.blot_config import downsample_factor
 from dotblotr import BlotData
+from dotblotr.profiling import profile_stage
+from .fixed_grid import get_grid_intensities
+from .measure import label_dtype, label_mean_intensities
 
+REGION_PROPERTIES = ('label', 'area', 'perimeter', 'centroid', 'mean_intensity')
 
-def _calc_circularity(region):
+
+def _calc_circularity(areas: np.ndarray, perimeters: np.ndarray) -> np.ndarray:
     """
-    Calculate the circularity of region.
+    Calculate the circularity of each region.
 
     Parameters:
     -----------
-    region :
-        The region to calculate the circularity
+    areas : np.ndarray
+        The area of each region
+    perimeters : np.ndarray
+        The perimeter of each region
 
     Returns:
     --------
-    circularity : float
-        The circularity
+    circularity : np.ndarray
+        The circularity of each region. Regions with no perimeter have
+        a circularity of 0.
     """
-    area = region.area
-    perimeter = region.perimeter
+    areas = np.asarray(areas, dtype=float)
+    perimeters = np.asarray(perimeters, dtype=float)
 
-    if perimeter > 0:
-        circularity = 4 * area * np.pi / perimeter ** 2
-    else:
-        circularity = 0
+    circularity = np.zeros_like(areas)
+    has_perimeter = perimeters > 0
+    circularity[has_perimeter] = 4 * areas[has_perimeter] * np.pi / perimeters[has_perimeter] ** 2
 
     return circularity
 
@@ -47,58 +59,134 @@ def _find_indices(coords, n_indices):
     return labels, indices
 
 
-def _find_label_mapping(regions: List, blot_config: BlotConfig) -> Tuple[Dict, np.ndarray]:
+def _find_indices_lattice(coords: np.ndarray, n_indices: int, pitch: Union[None, float] = None):
+    """
+    Assign 1D coordinates to grid indices by splitting the sorted coordinates at the gaps.
 
-    blob_labels = [r.label for r in regions]
+    Parameters:
+    -----------
+    coords : np.ndarray
+        The coordinate of each spot along one axis
+    n_indices : int
+        The number of grid positions along the axis
+    pitch : Union[None, float]
+        The grid pitch in pixels. If None, the coordinates are split at the
+        n_indices - 1 largest gaps. Otherwise, they are split at gaps larger than
+        half the pitch and each cluster is assigned to the nearest position of a
+        lattice fit to all clusters, so empty grid positions are skipped.
 
-    coords = np.array([r.centroid for r in regions])
-    row_coords = coords[:, 0]
-    col_coords = coords[:, 1]
+    Returns:
+    --------
+    labels : np.ndarray
+        The cluster label of each coordinate
+    indices : np.ndarray
+        The grid index of each cluster label. Clusters that are off the lattice
+        or outside of the n_indices grid positions have index -1.
+    """
+    if len(coords) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
 
-    row_labels, row_indices = _find_indices(row_coords, blot_config.n_rows)
-    col_labels, col_indices = _find_indices(col_coords, blot_config.n_cols)
+    order = np.argsort(coords, kind='stable')
+    gaps = np.diff(coords[order])
 
-    label_mapping = {}
-    grid_coordinates = []
-    for i, (row_index, col_index) in enumerate(zip(row_labels, col_labels)):
-        r = row_indices[row_index]
-        row_label = blot_config.get_row_label(r)
+    if pitch is None:
+        n_splits = min(n_indices, len(coords)) - 1
+        is_split = np.zeros(len(gaps), dtype=bool)
+        is_split[np.argsort(gaps, kind='stable')[len(gaps) - n_splits:]] = True
+    else:
+        is_split = gaps > (pitch / 2)
 
-        c = col_indices[col_index]
-        col_label = blot_config.get_col_label(c)
+    # clusters are labeled in order of increasing coordinate
+    sorted_labels = np.concatenate(([0], np.cumsum(is_split)))
+    labels = np.empty(len(coords), dtype=int)
+    labels[order] = sorted_labels
 
-        dot_name = row_label + col_label
+    if pitch is None:
+        indices = np.arange(sorted_labels[-1] + 1)
+    else:
+        counts = np.bincount(labels)
+        centers = np.bincount(labels, weights=coords) / counts
+
+        # the lattice offset is the circular mean of the cluster phases weighted by
+        # the cluster sizes, so a small off-lattice cluster (e.g., debris) does not move it
+        phases = np.exp(2j * np.pi * centers / pitch)
+        offset = pitch * np.angle(np.sum(counts * phases)) / (2 * np.pi)
+        positions = np.round((centers - offset) / pitch).astype(int)
+        on_lattice = np.abs(centers - offset - positions * pitch) <= (pitch / 4)
+        if not np.any(on_lattice):
+            return labels, np.full(len(centers), -1)
+
+        # place the grid at the lattice positions that cover the most spots
+        lattice_positions = positions[on_lattice]
+        first_positions = np.arange(
+            lattice_positions.min(), max(lattice_positions.min(), lattice_positions.max() - n_indices + 1) + 1
+        )
+        in_grid = (positions[None, :] >= first_positions[:, None]) \
+            & (positions[None, :] < first_positions[:, None] + n_indices)
+        n_covered = (in_grid & on_lattice[None, :]) @ counts
+        best_first = np.argmax(n_covered)
+
+        indices = positions - first_positions[best_first]
+        indices[~(in_grid[best_first] & on_lattice)] = -1
 
-        label_mapping[blob_labels[i]] = dot_name
+    return labels, indices
 
-        grid_coordinates.append([r, c])
 
-    return label_mapping, np.array(grid_coordinates)
+def _find_label_mapping(regions: pd.DataFrame, blot_config: BlotConfig) -> Tuple[Dict, np.ndarray]:
+
+    blob_labels = regions['label'].values
+    row_coords = regions['centroid-0'].values
+    col_coords = regions['centroid-1'].values
+
+    grid_method = blot_config.grid_method
+    if grid_method == 'kmeans':
+        row_labels, row_indices = _find_indices(row_coords, blot_config.n_rows)
+        col_labels, col_indices = _find_indices(col_coords, blot_config.n_cols)
+    elif grid_method == 'lattice':
+        pixel_size = blot_config.pixel_size
+        if pixel_size is None:
+            warnings.warn(
+                'the lattice grid method needs pixel_size in the array config to use row_pitch and '
+                'col_pitch. The spots are assigned to the grid at the largest gaps instead.'
+            )
+            row_pitch = None
+            col_pitch = None
+        else:
+            row_pitch = blot_config.row_pitch / pixel_size
+            col_pitch = blot_config.col_pitch / pixel_size
+        row_labels, row_indices = _find_indices_lattice(row_coords, blot_config.n_rows, row_pitch)
+        col_labels, col_indices = _find_indices_lattice(col_coords, blot_config.n_cols, col_pitch)
+    else:
+        raise ValueError('grid_method must be kmeans or lattice, got {}'.format(grid_method))
+
+    rows = row_indices[row_labels]
+    cols = col_indices[col_labels]
 
+    # blobs off the grid (only found by the lattice grid method) are not mapped
+    on_grid = (rows >= 0) & (cols >= 0)
+    label_mapping = {
+        blob_label: blot_config.get_row_label(r) + blot_config.get_col_label(c)
+        for blob_label, r, c in zip(blob_labels[on_grid], rows[on_grid], cols[on_grid])
+    }
+    grid_coordinates = np.column_stack((rows[on_grid], cols[on_grid]))
 
-def _make_blob_df(regions: List, label_mapping: Dict, grid_coordinates: np.ndarray) -> pd.DataFrame:
+    return label_mapping, grid_coordinates
 
-    areas = [r.area for r in regions]
-    mean_intensities = [r.mean_intensity for r in regions]
-    dot_names = [label_mapping[r.label] for r in regions]
-    blob_labels = [r.label for r in regions]
 
-    rows = grid_coordinates[:, 0]
-    cols = grid_coordinates[:, 1]
+def _make_blob_df(regions: pd.DataFrame, label_mapping: Dict, grid_coordinates: np.ndarray) -> pd.DataFrame:
 
-    coords = np.array([r.centroid for r in regions])
-    y_coords = coords[:, 0]
-    x_coords = coords[:, 1]
+    blob_labels = regions['label'].values
+    dot_names = [label_mapping[l] for l in blob_labels]
 
     data = {
         'dot_name': dot_names,
         'blob_label': blob_labels,
-        'row': rows,
-        'col': cols,
-        'x': x_coords,
-        'y': y_coords,
-        'mean_intensity': mean_intensities,
-        'area': areas,
+        'row': grid_coordinates[:, 0],
+        'col': grid_coordinates[:, 1],
+        'x': regions['centroid-1'].values,
+        'y': regions['centroid-0'].values,
+        'mean_intensity': regions['mean_intensity'].values,
+        'area': regions['area'].values,
     }
 
     blob_df = pd.DataFrame(data)
@@ -106,50 +194,223 @@ def _make_blob_df(regions: List, label_mapping: Dict, grid_coordinates: np.ndarr
     return blob_df
 
 
-def find_spots(im: np.ndarray, spot_params: dict) -> Tuple[List, np.ndarray]:
+def _keep_labels(label_image: np.ndarray, labels: List[int]) -> np.ndarray:
+    """
+    Set all labels not in labels to 0 in a single pass over the image.
+    The filtered label image uses the smallest unsigned integer dtype
+    that can hold the labels.
+
+    Parameters:
+    -----------
+    label_image : np.ndarray
+        The label image to filter
+    labels : List[int]
+        The labels to keep
+
+    Returns:
+    --------
+    filtered_label_image : np.ndarray
+        The label image containing only the kept labels
+    """
+    max_label = int(label_image.max())
+    label_lut = np.zeros(max_label + 1, dtype=label_dtype(max_label))
+    labels = np.asarray(labels, dtype=int)
+    label_lut[labels] = labels
+
+    return label_lut[label_image]
+
+
+def _binarize(im: np.ndarray, spot_params: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Binarize an image with a median filter, Otsu threshold, closing and erosion.
+
+    Parameters:
+    -----------
+    im : np.ndarray
+        The single plane image to binarize
+    spot_params : dict
+        The spot_params from the array config
+
+    Returns:
+    --------
+    eroded_bw : np.ndarray
+        The binary spot mask
+    bw : np.ndarray
+        The binary mask before erosion
+    """
     med_filt_size = spot_params['med_filt_size']
     block_size = spot_params['block_size']
     closing_size = spot_params['closing_size']
     erosion_size = spot_params['erosion_size']
+
+    with profile_stage('median_filter'):
+        filtered = median(im, square(med_filt_size))
+    with profile_stage('threshold_morphology'):
+        #thresh = threshold_local(filtered, block_size=block_size)
+        thresh = threshold_otsu(filtered)
+        bw = closing(filtered > thresh, square(closing_size))
+        eroded_bw = erosion(bw, selem=disk(erosion_size))
+
+    return eroded_bw, bw
+
+
+def _scale_spot_params(spot_params: dict, factor: int) -> dict:
+    """
+    Scale the pixel sizes in spot_params for an image downsampled by factor.
+    """
+    scaled_params = dict(spot_params)
+    scaled_params['med_filt_size'] = max(1, int(round(spot_params['med_filt_size'] / factor)))
+    scaled_params['closing_size'] = max(1, int(round(spot_params['closing_size'] / factor)))
+    scaled_params['erosion_size'] = int(round(spot_params['erosion_size'] / factor))
+    scaled_params['min_area'] = spot_params['min_area'] / factor ** 2
+
+    return scaled_params
+
+
+def _segment_coarse_to_fine(im: np.ndarray, spot_params: dict, factor: int) -> np.ndarray:
+    """
+    Segment the spots on a downsampled image and then refine the spot boundaries
+    against the full resolution image.
+
+    The spots and the Otsu threshold are found on the downsampled image. The full
+    resolution pixels in the coarse pixels around the boundary of the thresholded
+    coarse mask are then median filtered with med_filt_size and thresholded again,
+    while the other pixels keep their coarse value. The full resolution mask is
+    closed with closing_size and eroded by erosion_size using the distance transform,
+    which is equivalent to erosion with a disk. Each full resolution component takes
+    the label of the coarse spot it overlaps.
+
+    Parameters:
+    -----------
+    im : np.ndarray
+        The single plane image to segment
+    spot_params : dict
+        The spot_params from the array config
+    factor : int
+        The downsampling factor
+
+    Returns:
+    --------
+    label_image : np.ndarray
+        The full resolution label image
+    """
+    med_filt_size = spot_params['med_filt_size']
+    closing_size = spot_params['closing_size']
+    erosion_size = spot_params['erosion_size']
+    coarse_params = _scale_spot_params(spot_params, factor)
+
+    coarse_im = downscale_local_mean(im, (factor, factor))
+    coarse_filtered = median(coarse_im, square(coarse_params['med_filt_size']))
+    thresh = threshold_otsu(coarse_filtered)
+    coarse_fg = coarse_filtered > thresh
+    coarse_bw = closing(coarse_fg, square(coarse_params['closing_size']))
+    coarse_eroded_bw = erosion(coarse_bw, selem=disk(coarse_params['erosion_size']))
+    coarse_labels = label(clear_border(coarse_eroded_bw))
+
+    def _upsample(coarse: np.ndarray) -> np.ndarray:
+        upsampled = np.repeat(np.repeat(coarse, factor, axis=0), factor, axis=1)
+        return upsampled[:im.shape[0], :im.shape[1]]
+
+    # only the coarse pixels near the boundary can mix spot and background pixels.
+    # the band is two coarse pixels wide on each side to cover the shift of even sized
+    # coarse filter footprints.
+    coarse_band = binary_dilation(coarse_fg, iterations=2) & ~binary_erosion(coarse_fg, iterations=2)
+    band = _upsample(coarse_band)
+    bw = _upsample(coarse_fg & ~coarse_band)
+
+    # median filter and threshold only the full resolution pixels in the band
+    band_rows, band_cols = np.nonzero(band)
+    half_size = med_filt_size // 2
+    windows = sliding_window_view(np.pad(im, half_size, mode='edge'), (med_filt_size, med_filt_size))
+    band_windows = windows[band_rows, band_cols].reshape(len(band_rows), -1)
+    bw[band_rows, band_cols] = np.median(band_windows, axis=1) > thresh
+
+    bw = closing(bw, square(closing_size))
+    eroded_bw = distance_transform_edt(bw) > erosion_size
+
+    # label each full resolution component with the coarse spot it overlaps
+    fine_labels, n_fine_labels = label(eroded_bw, return_num=True)
+    upsampled_labels = _upsample(coarse_labels)
+    overlap = (fine_labels > 0) & (upsampled_labels > 0)
+    label_lut = np.zeros(n_fine_labels + 1, dtype=label_dtype(coarse_labels.max()))
+    label_lut[fine_labels[overlap]] = upsampled_labels[overlap]
+
+    return label_lut[fine_labels]
+
+
+def find_spots(im: np.ndarray, spot_params: dict) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Segment the spots in an image.
+
+    If spot_params contains a downsample factor greater than 1, the spots are
+    segmented on the image downsampled by that factor (with the pixel sizes in
+    spot_params scaled to match) and each spot mask is then refined at full
+    resolution inside its bounding box.
+
+    Parameters:
+    -----------
+    im : np.ndarray
+        The single plane image to segment
+    spot_params : dict
+        The spot_params from the array config
+
+    Returns:
+    --------
+    regions : pd.DataFrame
+        Table with the label, area, perimeter, centroid
+        (centroid-0 is the row, centroid-1 is the column) and
+        mean_intensity of each spot that passed the filters
+    label_image : np.ndarray
+        The label image containing only the spots in regions
+    """
     min_area = spot_params['min_area']
     circ_thresh = spot_params['circ_thresh']
-
-    # Binarize image
-    filtered = median(im, square(med_filt_size))
-    #thresh = threshold_local(filtered, block_size=block_size)
-    thresh = threshold_otsu(filtered)
-    bw = closing(filtered > thresh, square(closing_size))
-    eroded_bw = erosion(bw, selem=disk(erosion_size))
+    downsample = downsample_factor(spot_params)
 
     # Make the label_image
-    cleared = clear_border(eroded_bw)
-    label_image = label(cleared)
-    regions = regionprops(label_image=label_image, intensity_image=im)
+    if downsample > 1:
+        with profile_stage('coarse_to_fine_segmentation'):
+            label_image = _segment_coarse_to_fine(im, spot_params, downsample)
+    else:
+        eroded_bw, _ = _binarize(im, spot_params)
+        with profile_stage('label'):
+            cleared = clear_border(eroded_bw)
+            label_image = label(cleared)
 
-    # Filter regions
-    size_filtered = [r for r in regions if r.area > min_area]
-    circularity = [_calc_circularity(r) for r in size_filtered]
-    circularity_filtered = [r for c, r in zip(circularity, size_filtered) if c > circ_thresh]
+    with profile_stage('regionprops'):
+        regions = pd.DataFrame(
+            regionprops_table(label_image, intensity_image=im, properties=REGION_PROPERTIES)
+        )
 
-    # Remove filtered labels from label image
-    good_labels = [r.label for r in circularity_filtered]
+    with profile_stage('filter_regions'):
+        # Filter regions
+        circularity = _calc_circularity(regions['area'].values, regions['perimeter'].values)
+        keep = (regions['area'].values > min_area) & (circularity > circ_thresh)
+        regions = regions.loc[keep].reset_index(drop=True)
 
-    unique_labels = np.unique(label_image)
-    in_good_labels = np.isin(unique_labels, good_labels)
-    labels_to_remove = unique_labels[np.logical_not(in_good_labels)]
+        # Remove filtered labels from label image
+        label_image = _keep_labels(label_image, regions['label'].values)
 
-    for l in labels_to_remove:
-        label_image[label_image == l] = 0
+    return regions, label_image
 
-    return circularity_filtered, label_image
 
+def get_intensities(im: np.ndarray, blot_config_path: Union[str, BlotConfig]) -> BlotData:
 
-def get_intensities(im: np.ndarray, blot_config_path: str) -> BlotData:
+    blot_config = load_blot_config(blot_config_path)
+    detection_method = blot_config.detection_method
+    if detection_method == 'fixed_grid':
+        return get_grid_intensities(im, blot_config)
+    elif detection_method != 'segment':
+        raise ValueError('detection_method must be segment or fixed_grid, got {}'.format(detection_method))
 
-    blot_config = BlotConfig(config=blot_config_path)
     regions, label_im = find_spots(im, spot_params=blot_config.spot_params)
 
-    label_mapping, grid_coords = _find_label_mapping(regions, blot_config)
+    with profile_stage('grid_mapping'):
+        label_mapping, grid_coords = _find_label_mapping(regions, blot_config)
+
+        if len(label_mapping) < len(regions):
+            regions = regions.loc[regions['label'].isin(label_mapping)].reset_index(drop=True)
+            label_im = _keep_labels(label_im, regions['label'].values)
 
     blob_df = _make_blob_df(regions, label_mapping, grid_coords)
 
@@ -165,20 +426,48 @@ def get_intensities(im: np.ndarray, blot_config_path: str) -> BlotData:
     return blob_data
 
 
-def get_intensities_from_mask(im: np.ndarray, blot_data: BlotData) -> BlotData:
+def get_multichannel_intensities_from_mask(ims: List[np.ndarray], blot_data: BlotData) -> List[BlotData]:
+    """
+    Measure the spot intensities of several images against one mask.
 
+    Parameters:
+    -----------
+    ims : List[np.ndarray]
+        The images to measure (e.g., one for each probe channel)
+    blot_data : BlotData
+        The segmented blot to use as the mask
+
+    Returns:
+    --------
+    blot_datas : List[BlotData]
+        The measured blot for each image in ims
+    """
     label_im = blot_data.label_im
-    regions = regionprops(label_im, intensity_image=im)
-    df = _make_blob_df(regions, blot_data.label_mapping, blot_data.grid_coords)
 
-    new_blot_data = BlotData(
-        blob_df=df,
-        label_im=label_im,
-        blot_config=blot_data.blot_config,
-        raw_im=im,
-        label_mapping=blot_data.label_mapping,
-        grid_coords=blot_data.grid_coords,
-        mask_raw_im=blot_data.raw_im
-    )
+    # the spot geometry is shared with the mask, so only the intensities are measured
+    mean_intensities = label_mean_intensities(ims, label_im, blot_data.df['blob_label'].values)
+
+    blot_datas = []
+    for im, im_intensities in zip(ims, mean_intensities):
+        df = blot_data.df.copy()
+        df['mean_intensity'] = im_intensities
+
+        new_blot_data = BlotData(
+            blob_df=df,
+            label_im=label_im,
+            blot_config=blot_data.blot_config,
+            raw_im=im,
+            label_mapping=blot_data.label_mapping,
+            grid_coords=blot_data.grid_coords,
+            mask_raw_im=blot_data.raw_im
+        )
+        blot_datas.append(new_blot_data)
+
+    return blot_datas
+
+
+def get_intensities_from_mask(im: np.ndarray, blot_data: BlotData) -> BlotData:
+
+    new_blot_data = get_multichannel_intensities_from_mask([im], blot_data)[0]
 
     return new_blot_data
@@ -0,0 +1,179 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.signal import correlate
+from skimage.morphology import disk
+
+from dotblotr import BlotConfig
+from dotblotr import BlotData
+from dotblotr.profiling import profile_stage
+from .measure import label_dtype, label_mean_intensities
+
+
+def _grid_pitch(blot_config: BlotConfig) -> Tuple[float, float]:
+    """
+    Get the row and column pitch of the array in pixels.
+
+    Parameters:
+    -----------
+    blot_config : BlotConfig
+        The array config. Must contain pixel_size.
+
+    Returns:
+    --------
+    row_pitch : float
+        The row pitch in pixels
+    col_pitch : float
+        The column pitch in pixels
+    """
+    pixel_size = blot_config.pixel_size
+    if pixel_size is None:
+        raise ValueError('pixel_size must be set in the array config for fixed_grid detection')
+
+    return blot_config.row_pitch / pixel_size, blot_config.col_pitch / pixel_size
+
+
+def _register_axis(profile: np.ndarray, n_positions: int, pitch: float, radius: float) -> float:
+    """
+    Find the offset of a 1D lattice of dots by cross-correlating
+    an intensity profile with a synthetic dot template.
+
+    Parameters:
+    -----------
+    profile : np.ndarray
+        The mean image intensity along the axis
+    n_positions : int
+        The number of grid positions along the axis
+    pitch : float
+        The grid pitch in pixels
+    radius : float
+        The dot radius in pixels
+
+    Returns:
+    --------
+    first_center : float
+        The coordinate of the first grid position along the axis
+    """
+    centers = radius + pitch * np.arange(n_positions)
+    template_coords = np.arange(int(np.ceil(centers[-1] + radius)) + 1)
+    distances = np.abs(template_coords[:, None] - centers[None, :]).min(axis=1)
+    template = (distances <= radius).astype(float)
+    template -= template.mean()
+
+    if len(template) > len(profile):
+        raise ValueError('the image is smaller than the expected array')
+
+    scores = correlate(profile - profile.mean(), template, mode='valid')
+    offset = np.argmax(scores)
+
+    return offset + radius
+
+
+def _make_roi_label_image(
+        im_shape: Tuple[int, int], y_coords: np.ndarray, x_coords: np.ndarray, radius: float
+) -> np.ndarray:
+    """
+    Make a label image with a circular ROI at each grid position.
+    The ROI at position i has label i + 1.
+
+    Parameters:
+    -----------
+    im_shape : Tuple[int, int]
+        The shape of the image
+    y_coords : np.ndarray
+        The row coordinate of each grid position
+    x_coords : np.ndarray
+        The column coordinate of each grid position
+    radius : float
+        The ROI radius in pixels
+
+    Returns:
+    --------
+    label_im : np.ndarray
+        The ROI label image
+    """
+    roi_y, roi_x = np.nonzero(disk(int(round(radius))))
+    roi_y = roi_y - int(round(radius))
+    roi_x = roi_x - int(round(radius))
+
+    ys = (np.round(y_coords).astype(int)[:, None] + roi_y[None, :]).ravel()
+    xs = (np.round(x_coords).astype(int)[:, None] + roi_x[None, :]).ravel()
+    roi_labels = np.repeat(np.arange(1, len(y_coords) + 1), len(roi_y))
+
+    in_image = (ys >= 0) & (ys < im_shape[0]) & (xs >= 0) & (xs < im_shape[1])
+    label_im = np.zeros(im_shape, dtype=label_dtype(len(y_coords)))
+    label_im[ys[in_image], xs[in_image]] = roi_labels[in_image]
+
+    return label_im
+
+
+def get_grid_intensities(im: np.ndarray, blot_config: BlotConfig) -> BlotData:
+    """
+    Measure the spot intensities at the known grid positions without segmenting the image.
+    The lattice is registered to the image once by cross-correlating the row and column
+    intensity profiles with a synthetic dot template. Each position is then measured in
+    a circular ROI, so positions without a visible dot are included.
+
+    The array config must contain pixel_size (the size of a pixel in the units of
+    row_pitch and col_pitch). The ROI radius in pixels is set by roi_radius in
+    spot_params and defaults to 0.35 of the smaller pitch.
+
+    Parameters:
+    -----------
+    im : np.ndarray
+        The single plane image to measure
+    blot_config : BlotConfig
+        The array config
+
+    Returns:
+    --------
+    blot_data : BlotData
+        The measured blot
+    """
+    n_rows = blot_config.n_rows
+    n_cols = blot_config.n_cols
+    row_pitch, col_pitch = _grid_pitch(blot_config)
+    radius = blot_config.spot_params.get('roi_radius', 0.35 * min(row_pitch, col_pitch))
+
+    # register the lattice to the image
+    with profile_stage('grid_registration'):
+        first_row = _register_axis(im.mean(axis=1), n_rows, row_pitch, radius)
+        first_col = _register_axis(im.mean(axis=0), n_cols, col_pitch, radius)
+
+    rows, cols = np.divmod(np.arange(n_rows * n_cols), n_cols)
+    y_coords = first_row + rows * row_pitch
+    x_coords = first_col + cols * col_pitch
+
+    # measure each ROI
+    with profile_stage('measure_rois'):
+        label_im = _make_roi_label_image(im.shape, y_coords, x_coords, radius)
+        blob_labels = np.arange(1, n_rows * n_cols + 1)
+        mean_intensities = label_mean_intensities([im], label_im, blob_labels)[0]
+        areas = np.bincount(label_im.ravel(), minlength=len(blob_labels) + 1)[blob_labels]
+
+    dot_names = [blot_config.get_row_label(r) + blot_config.get_col_label(c) for r, c in zip(rows, cols)]
+    label_mapping = dict(zip(blob_labels, dot_names))
+    grid_coords = np.column_stack((rows, cols))
+
+    blob_df = pd.DataFrame({
+        'dot_name': dot_names,
+        'blob_label': blob_labels,
+        'row': rows,
+        'col': cols,
+        'x': x_coords,
+        'y': y_coords,
+        'mean_intensity': mean_intensities,
+        'area': areas,
+    })
+
+    blot_data = BlotData(
+        blob_df,
+        label_im=label_im,
+        blot_config=blot_config,
+        raw_im=im,
+        label_mapping=label_mapping,
+        grid_coords=grid_coords
+    )
+
+    return blot_data
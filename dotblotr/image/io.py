@@ -1,7 +1,66 @@
-from typing import Tuple
+from typing import List, Tuple
 
 import numpy as np
 from skimage import io
+import tifffile
+
+# tiff axis codes that can hold the channels
+CHANNEL_AXES = ('S', 'C')
+
+
+def _read_tiff_channels(file_path: str, channels: List[int]) -> List[np.ndarray]:
+    """ Read channels from a tiff without holding the full image in memory.
+    Uncompressed images are memory-mapped and images with one page per
+    channel only have the requested pages read. Otherwise, the full image
+    is read and released once the channels are copied.
+    """
+    with tifffile.TiffFile(file_path) as tif:
+        series = tif.series[0]
+        axes = series.axes
+        channel_axis = next((axes.index(a) for a in CHANNEL_AXES if a in axes), None)
+        if channel_axis is None:
+            raise ValueError('{} does not have a channel axis ({})'.format(file_path, axes))
+
+        if series.dataoffset is not None:
+            im = tifffile.memmap(file_path, mode='r')
+        elif channel_axis == 0 and len(series.pages) == series.shape[0]:
+            return [series.pages[channel].asarray() for channel in channels]
+        else:
+            im = series.asarray()
+
+    channel_ims = [np.ascontiguousarray(np.take(im, channel, axis=channel_axis)) for channel in channels]
+    del im
+
+    return channel_ims
+
+
+def open_channels(file_path: str, channels: List[int]) -> List[np.ndarray]:
+    """ Opens a multichannel image once and returns the requested channels.
+    Tiff files are read lazily so that the full multichannel
+    image is not kept in memory.
+
+    Parameters
+    -----------
+    file_path : str
+        Path to the multichannel tif to open
+    channels : List[int]
+        Indices of the channels to return
+
+    Returns
+    -----------
+    channel_ims : List[np.ndarray]
+        Contiguous single plane image for each of the requested channels,
+        in the order of channels
+
+    """
+    try:
+        return _read_tiff_channels(file_path, channels)
+    except (tifffile.TiffFileError, ValueError):
+        # not a tiff tifffile can read lazily
+        im = io.imread(file_path)
+        channel_ims = [np.ascontiguousarray(im[:, :, channel]) for channel in channels]
+
+        return channel_ims
 
 
 def open_rgb(
@@ -28,8 +87,6 @@ def open_rgb(
         Single plane probe image
 
     """
-    im = io.imread(file_path)
-    control_im = im[:, :, control_channel]
-    probe_im = im[:, :, probe_channel]
+    control_im, probe_im = open_channels(file_path, [control_channel, probe_channel])
 
     return control_im, probe_im
@@ -0,0 +1,187 @@
+import os
+import tempfile
+from typing import Tuple, Union
+import warnings
+
+import numpy as np
+import pandas as pd
+from skimage.registration import phase_cross_correlation
+
+from dotblotr import BlotConfig, BlotData, load_blot_config
+
+MASK_EXTENSION = '.npz'
+BLOB_DF_COLS = ['dot_name', 'blob_label', 'row', 'col', 'x', 'y', 'mean_intensity', 'area']
+# the intensities are measured on each new image
+MASK_DF_COLS = [c for c in BLOB_DF_COLS if c != 'mean_intensity']
+
+
+def _estimate_translation(reference_im: np.ndarray, im: np.ndarray) -> np.ndarray:
+    """
+    Estimate the (row, col) translation of im relative to reference_im
+    with phase correlation, to the nearest pixel.
+    """
+    shift = phase_cross_correlation(reference_im.astype(float), im.astype(float))[0]
+
+    return -np.round(shift).astype(int)
+
+
+def _translate_labels(label_im: np.ndarray, translation: np.ndarray) -> np.ndarray:
+    """
+    Translate a label image by whole pixels. Labels moved outside of the image are
+    cropped and the uncovered pixels are set to the background.
+    """
+    translated = np.zeros_like(label_im)
+    src = []
+    dst = []
+    for shift, size in zip(translation, label_im.shape):
+        shift = int(np.clip(shift, -size, size))
+        src.append(slice(max(-shift, 0), size - max(shift, 0)))
+        dst.append(slice(max(shift, 0), size - max(-shift, 0)))
+    translated[tuple(dst)] = label_im[tuple(src)]
+
+    return translated
+
+
+class MaskStore:
+    """
+    On-disk store of the segmented spot masks of strips, so that re-imaged strips
+    (e.g., at a different exposure or after re-probing) can be quantified
+    without segmenting them again. Each mask is saved as <strip_id>.npz with the
+    label image, the grid mapping and the control image it was segmented from.
+
+    Parameters:
+    -----------
+    store_dir : str
+        The directory to save the masks in. Created if it does not exist.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _mask_path(self, strip_id: str) -> str:
+        return os.path.join(self.store_dir, str(strip_id) + MASK_EXTENSION)
+
+    def __contains__(self, strip_id: str) -> bool:
+        return os.path.isfile(self._mask_path(strip_id))
+
+    def save(self, strip_id: str, blot_data: BlotData):
+        """
+        Save the mask of a segmented blot. An existing mask for strip_id is replaced.
+
+        Parameters:
+        -----------
+        strip_id : str
+            The identifier of the strip
+        blot_data : BlotData
+            The segmented blot, e.g., from get_intensities()
+        """
+        df = blot_data.df
+        label_mapping = blot_data.label_mapping
+        arrays = {'df_' + c: df[c].values for c in MASK_DF_COLS}
+        arrays['df_dot_name'] = df['dot_name'].values.astype(str)
+        if blot_data.raw_im is not None:
+            arrays['reference_im'] = blot_data.raw_im
+
+        # write to a uniquely named temporary file first so that readers never see a
+        # partial mask and concurrent saves of the same strip don't collide
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, prefix='.tmp', suffix=MASK_EXTENSION)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    label_im=blot_data.label_im,
+                    grid_coords=blot_data.grid_coords,
+                    mapping_labels=np.array(list(label_mapping.keys())),
+                    mapping_names=np.array(list(label_mapping.values()), dtype=str),
+                    **arrays
+                )
+            os.replace(tmp_path, self._mask_path(strip_id))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def load(
+            self,
+            strip_id: str,
+            blot_config: Union[str, BlotConfig],
+            im: Union[None, np.ndarray] = None,
+            register: bool = False
+    ) -> Union[None, BlotData]:
+        """
+        Load the mask of a strip.
+
+        Parameters:
+        -----------
+        strip_id : str
+            The identifier of the strip
+        blot_config : Union[str, BlotConfig]
+            The array config or the path to it
+        im : Union[None, np.ndarray]
+            The new control image of the strip. Required if register is True.
+            If given, it must have the same shape as the image the mask was
+            segmented from.
+        register : bool
+            If True, the mask is translated to the new image. The translation is
+            estimated by phase correlation with the control image the mask was
+            segmented from. Spots that are translated out of the image are
+            dropped with a warning. Default is False.
+
+        Returns:
+        --------
+        blot_data : Union[None, BlotData]
+            The blot with the stored mask and spot geometry, without intensities.
+            None if there is no mask for strip_id.
+        """
+        mask_path = self._mask_path(strip_id)
+        if not os.path.isfile(mask_path):
+            return None
+
+        with np.load(mask_path) as mask:
+            label_im = mask['label_im']
+            grid_coords = mask['grid_coords']
+            label_mapping = dict(zip(mask['mapping_labels'].tolist(), mask['mapping_names'].tolist()))
+            df = pd.DataFrame({
+                c: mask['df_' + c] if c in MASK_DF_COLS else np.nan for c in BLOB_DF_COLS
+            })
+            reference_im = mask['reference_im'] if 'reference_im' in mask.files else None
+
+        if im is not None and im.shape[:2] != label_im.shape:
+            raise ValueError(
+                'the stored mask of strip {} is {} but the image is {}'.format(
+                    strip_id, label_im.shape, im.shape[:2]
+                )
+            )
+
+        if register:
+            if im is None or reference_im is None:
+                raise ValueError('registering a mask requires the new image and a stored reference image')
+            translation = _estimate_translation(reference_im, im)
+            if np.any(translation != 0):
+                label_im = _translate_labels(label_im, translation)
+                df['y'] = df['y'] + translation[0]
+                df['x'] = df['x'] + translation[1]
+
+                # drop the spots that were translated out of the image
+                blob_labels = df['blob_label'].values
+                in_image = np.bincount(label_im.ravel(), minlength=blob_labels.max() + 1)[blob_labels] > 0
+                if not np.all(in_image):
+                    warnings.warn(
+                        '{} spots of strip {} were translated out of the image and are dropped'.format(
+                            np.sum(~in_image), strip_id
+                        )
+                    )
+                    df = df.loc[in_image].reset_index(drop=True)
+                    grid_coords = grid_coords[in_image]
+                    label_mapping = {l: label_mapping[l] for l in blob_labels[in_image].tolist()}
+
+        blot_data = BlotData(
+            df,
+            label_im=label_im,
+            blot_config=load_blot_config(blot_config),
+            raw_im=None,
+            label_mapping=label_mapping,
+            grid_coords=grid_coords
+        )
+
+        return blot_data
@@ -0,0 +1,58 @@
+from typing import List
+
+import numpy as np
+
+
+def label_dtype(max_label: int) -> np.dtype:
+    """
+    Get the smallest unsigned integer dtype that can hold max_label.
+
+    Parameters:
+    -----------
+    max_label : int
+        The largest label in the label image
+
+    Returns:
+    --------
+    dtype : np.dtype
+        uint16, uint32 or uint64
+    """
+    for dtype in (np.uint16, np.uint32):
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+
+    return np.dtype(np.uint64)
+
+
+def label_mean_intensities(ims: List[np.ndarray], label_im: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    Calculate the mean intensity of each label in each image
+    with one pass over each image.
+
+    Parameters:
+    -----------
+    ims : List[np.ndarray]
+        The intensity images
+    label_im : np.ndarray
+        The label image. Must be the same shape as each image in ims.
+    labels : np.ndarray
+        The labels to calculate the mean intensities of
+
+    Returns:
+    --------
+    mean_intensities : np.ndarray
+        (n_images, n_labels) array with the mean intensity of
+        each label in labels for each image in ims.
+        Labels without any pixels have a mean intensity of NaN.
+    """
+    flat_labels = label_im.ravel()
+    n_bins = int(flat_labels.max()) + 1
+    counts = np.bincount(flat_labels, minlength=n_bins)[labels]
+
+    mean_intensities = np.empty((len(ims), len(labels)))
+    for i, im in enumerate(ims):
+        sums = np.bincount(flat_labels, weights=im.ravel(), minlength=n_bins)
+        with np.errstate(invalid='ignore'):
+            mean_intensities[i] = sums[labels] / counts
+
+    return mean_intensities
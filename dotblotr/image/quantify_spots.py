@@ -1,60 +1,180 @@
+from functools import lru_cache
+import os
 from os import path
+from typing import List, Union
 
+import numpy as np
 import pandas as pd
 
-from .find_spots import get_intensities, get_intensities_from_mask
-from .io import open_rgb
+from dotblotr import BlotConfig
+from dotblotr.analysis.hit_calling import call_hits
+from dotblotr.profiling import profile_stage
+from dotblotr.results_schema import apply_results_schema
+from .find_spots import get_intensities, get_intensities_from_mask, get_multichannel_intensities_from_mask
+from .io import open_channels
+from .mask_store import MaskStore
 
 MERGE_ON = 'dot_name'
-MERGE_COLS = [MERGE_ON, 'mean_intensity']
+
+
+@lru_cache(maxsize=32)
+def _load_assay_config(assay_config_path: str, mtime: float) -> pd.DataFrame:
+    return pd.read_csv(assay_config_path)
+
+
+def load_assay_config(assay_config: Union[pd.DataFrame, str]) -> pd.DataFrame:
+    """ Get the assay config table, parsing each CSV at most once per process.
+
+    Parameters
+    ----------
+    assay_config : Union[pd.DataFrame, str]
+        A loaded assay config (returned as is) or the path to the assay config CSV.
+
+    Returns
+    -------
+    assay_config : pd.DataFrame
+        The assay config. Tables loaded from the same unmodified file are
+        the same object, so they should not be modified in place.
+    """
+    if isinstance(assay_config, pd.DataFrame):
+        return assay_config
+
+    assay_config_path = os.path.abspath(assay_config)
+    return _load_assay_config(assay_config_path, os.path.getmtime(assay_config_path))
 
 
 def quantify_blot_array(
         im_path: str,
         strip_id: str,
-        array_config_path: str,
-        assay_config_path: str
+        array_config_path: Union[str, BlotConfig],
+        assay_config_path: Union[str, pd.DataFrame],
+        assay_id: Union[None, str] = None,
+        control_channel: int = 0,
+        probe_channels: Union[int, List[int]] = 1,
+        hit_calling: bool = True,
+        mask_store: Union[None, MaskStore] = None,
+        register_mask: bool = False
 ):
-    assay_config = pd.read_csv(assay_config_path)
-    control_image, probe_image = open_rgb(im_path)
-    control_blot = get_intensities(im=control_image, blot_config_path=array_config_path)
-    probe_blot = get_intensities_from_mask(im=probe_image, blot_data=control_blot)
-
-    assay_results = _compare_to_control(
-        control_blot=control_blot,
-        probe_blot=probe_blot,
-        assay_config=assay_config
-    )
-
-    assay_id = path.split(assay_config_path)[-1]
+    """ Quantify the dots on a strip and call the positive hits.
+
+    Parameters
+    ----------
+    im_path : str
+        Path to the RGB strip image.
+    strip_id : str
+        Identifier for the strip.
+    array_config_path : Union[str, BlotConfig]
+        Path to the array config JSON or an already loaded BlotConfig.
+    assay_config_path : Union[str, pd.DataFrame]
+        Path to the assay config CSV or an already loaded assay config table.
+    assay_id : Union[None, str]
+        Identifier for the assay. Defaults to the file name of the assay config.
+        Required if assay_config_path is a DataFrame.
+    control_channel : int
+        Index of the control channel used to segment the dots. Default is 0.
+    probe_channels : Union[int, List[int]]
+        Index or list of indices of the probe channels. All probe channels are
+        measured against the dots segmented in the control channel. Default is 1.
+    hit_calling : bool
+        If True, the hits are called with dotblotr.analysis.call_hits(). If False,
+        only the control and probe intensities are measured, so the hits can be
+        called for a whole batch afterwards. Default is True.
+    mask_store : Union[None, MaskStore]
+        If given and it has a mask for strip_id, the dots are measured with the stored
+        mask instead of segmenting the image. Otherwise the strip is segmented and
+        its mask is added to the store.
+    register_mask : bool
+        If True, a stored mask is translated to the control image before measuring.
+        Default is False.
+
+    Returns
+    -------
+    assay_results : pd.DataFrame
+        The results table for the strip in long format,
+        with one row per dot per probe channel. The string columns are
+        categoricals (see dotblotr.results_schema).
+    """
+    if assay_id is None:
+        if isinstance(assay_config_path, pd.DataFrame):
+            raise ValueError('assay_id must be given when the assay config is a DataFrame')
+        assay_id = path.split(assay_config_path)[-1]
+
+    if isinstance(probe_channels, int):
+        probe_channels = [probe_channels]
+
+    assay_config = load_assay_config(assay_config_path)
+    with profile_stage('read_image', strip_id=strip_id):
+        channel_images = open_channels(im_path, [control_channel] + list(probe_channels))
+    stored_blot = None
+    if mask_store is not None:
+        with profile_stage('load_mask', strip_id=strip_id):
+            stored_blot = mask_store.load(
+                strip_id, array_config_path, im=channel_images[0], register=register_mask
+            )
+    with profile_stage('detect_spots', strip_id=strip_id):
+        if stored_blot is not None:
+            control_blot = get_intensities_from_mask(im=channel_images[0], blot_data=stored_blot)
+        else:
+            control_blot = get_intensities(im=channel_images[0], blot_config_path=array_config_path)
+            if mask_store is not None:
+                mask_store.save(strip_id, control_blot)
+    with profile_stage('measure_probes', strip_id=strip_id):
+        probe_blots = get_multichannel_intensities_from_mask(ims=channel_images[1:], blot_data=control_blot)
+
+    with profile_stage('compare_to_control', strip_id=strip_id):
+        channel_results = []
+        for probe_channel, probe_blot in zip(probe_channels, probe_blots):
+            probe_results = _compare_to_control(
+                control_blot=control_blot,
+                probe_blot=probe_blot,
+                assay_config=assay_config
+            )
+            probe_results.insert(loc=0, column='channel', value=probe_channel)
+            channel_results.append(probe_results)
+        assay_results = pd.concat(channel_results, axis=0, ignore_index=True)
+
     assay_results.insert(loc=0, column='assay_id', value=assay_id)
 
     assay_results.insert(loc=1, column='strip_id', value=strip_id)
 
-    return assay_results
+    if hit_calling:
+        with profile_stage('call_hits', strip_id=strip_id):
+            assay_results = call_hits(assay_results)
+
+    return apply_results_schema(assay_results)
 
 
 def _compare_to_control(control_blot, probe_blot, assay_config):
 
-    # new control column names
     control_df = control_blot.df
-    probe_df = probe_blot.df[MERGE_COLS]
-
-    # add the source plate info and drop any rows for wells not present in assay
-    control_df = pd.merge(assay_config, control_df, on=MERGE_ON, how='outer', suffixes=('', ''))
-    control_df = control_df.dropna(axis=0)
-
-    # calculate the normalized intensity
-    assay_df = pd.merge(control_df, probe_df, on=MERGE_ON, how='outer', suffixes=('_control', '_probe'))
-    assay_df['norm_probe_intensity'] = assay_df['mean_intensity_probe'] / assay_df['mean_intensity_control']
-
-    # calculate the positive hit thresholds
-    neg_ctrls = assay_df.loc[assay_df['exp_group'] == 'neg']
-    neg_mean = neg_ctrls.norm_probe_intensity.mean()
-    neg_std = neg_ctrls.norm_probe_intensity.std()
-    assay_df['positive_threshold'] = neg_mean + assay_df['zscore_threshold'] * neg_std
-
-    # identify the positive hits
-    assay_df['pos_hit'] = assay_df['norm_probe_intensity'] > assay_df['positive_threshold']
+    if control_df[MERGE_ON].duplicated().any():
+        # a dot can be segmented as several blobs (e.g., a split dot or adjacent debris).
+        # keep the largest blob for each dot.
+        control_df = control_df.sort_values('area', ascending=False, kind='stable')
+        control_df = control_df.drop_duplicates(MERGE_ON).sort_index()
+
+    # align the assay config with the detected dots and drop the wells not present in the assay.
+    # the rows are kept in the assay config order.
+    control_positions = pd.Index(control_df[MERGE_ON]).get_indexer(assay_config[MERGE_ON])
+    keep = (control_positions >= 0) & assay_config.notna().all(axis=1).values
+    control_positions = control_positions[keep]
+
+    assay_cols = {c: assay_config[c].values[keep] for c in assay_config.columns}
+    control_cols = {
+        c.replace('mean_intensity', 'mean_intensity_control'): control_df[c].values[control_positions]
+        for c in control_df.columns if c != MERGE_ON
+    }
+
+    # look up the probe intensities by blob label
+    probe_df = probe_blot.df
+    probe_intensities = np.full(probe_df['blob_label'].max() + 1, np.nan)
+    probe_intensities[probe_df['blob_label'].values] = probe_df['mean_intensity'].values
+    probe_intensities = probe_intensities[control_cols['blob_label']]
+
+    assay_df = pd.DataFrame({
+        **assay_cols,
+        **control_cols,
+        'mean_intensity_probe': probe_intensities
+    })
 
     return assay_df
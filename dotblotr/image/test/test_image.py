@@ -2,13 +2,34 @@ import os
 
 import numpy as np
 import pandas as pd
+import pytest
+from skimage import io
 
-from dotblotr.image import quantify_blot_array
+from dotblotr import BlotConfig, BlotData
+from dotblotr.image import (
+    find_spots, get_intensities, load_assay_config, open_rgb, quantify_blot_array, MaskStore
+)
+from dotblotr.image.find_spots import _find_indices_lattice
+from dotblotr.image.quantify_spots import _compare_to_control
+from dotblotr.test.utils import make_simulated_df
 
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
 
-def test_quantify_blot():
+
+@pytest.fixture(scope='module')
+def im_path(tmp_path_factory):
+    im_path = str(tmp_path_factory.mktemp('strip') / 'simulated_strip.tif')
+    make_simulated_df(
+        im_name=im_path,
+        array_config_path=os.path.join(TEST_DIR, '384_tiny_config.json'),
+        assay_config_path=os.path.join(TEST_DIR, 'assay_config.csv')
+    )
+
+    return im_path
+
+
+def test_quantify_blot(im_path):
     dir_name = os.path.dirname(os.path.realpath(__file__))
-    im_path = os.path.join(dir_name, 'simulated_strip.tif')
     blot_config_path = os.path.join(dir_name, '384_tiny_config.json')
     assay_config_path = os.path.join(dir_name, 'assay_config.csv')
 
@@ -20,4 +41,228 @@ def test_quantify_blot():
     )
     exp_res_path = os.path.join(dir_name, 'expected_results_table.csv')
     results_table = pd.read_csv(exp_res_path)
-    np.all(results_table['norm_probe_intensity'] == assay_results['norm_probe_intensity'])
+
+    assert len(assay_results) == len(results_table)
+    merged = results_table.merge(
+        assay_results.astype({'dot_name': str}), on='dot_name', suffixes=('_expected', '')
+    )
+    assert len(merged) == len(results_table)
+    np.testing.assert_allclose(merged['norm_probe_intensity'], merged['norm_probe_intensity_expected'])
+
+
+def test_compare_to_control_duplicate_dot_name(im_path):
+    dir_name = os.path.dirname(os.path.realpath(__file__))
+    control_im, _ = open_rgb(im_path)
+    blot_data = get_intensities(control_im, os.path.join(dir_name, '384_tiny_config.json'))
+    assay_config = load_assay_config(os.path.join(dir_name, 'assay_config.csv'))
+    results = _compare_to_control(blot_data, blot_data, assay_config)
+
+    # a small extra blob (e.g., debris) assigned to the same dot as a detected dot
+    debris = blot_data.df.iloc[[5]].assign(blob_label=blot_data.df['blob_label'].max() + 1, area=10)
+    df = pd.concat([blot_data.df.iloc[:5], debris, blot_data.df.iloc[5:]], ignore_index=True)
+    duplicate_blot = BlotData(
+        df,
+        label_im=blot_data.label_im,
+        blot_config=blot_data.blot_config,
+        raw_im=None,
+        label_mapping=blot_data.label_mapping,
+        grid_coords=blot_data.grid_coords
+    )
+    duplicate_results = _compare_to_control(duplicate_blot, duplicate_blot, assay_config)
+
+    pd.testing.assert_frame_equal(duplicate_results, results)
+
+
+def test_quantify_blot_multichannel(im_path):
+    dir_name = os.path.dirname(os.path.realpath(__file__))
+    blot_config_path = os.path.join(dir_name, '384_tiny_config.json')
+    assay_config_path = os.path.join(dir_name, 'assay_config.csv')
+
+    single_results = quantify_blot_array(
+        im_path=im_path,
+        strip_id='test_blot',
+        array_config_path=blot_config_path,
+        assay_config_path=assay_config_path
+    )
+    multi_results = quantify_blot_array(
+        im_path=im_path,
+        strip_id='test_blot',
+        array_config_path=blot_config_path,
+        assay_config_path=assay_config_path,
+        probe_channels=[1, 2]
+    )
+
+    assert len(multi_results) == 2 * len(single_results)
+    channel_1_results = multi_results.loc[multi_results['channel'] == 1].reset_index(drop=True)
+    pd.testing.assert_frame_equal(channel_1_results, single_results)
+
+
+@pytest.mark.parametrize('pixel_size', [None, 0.09])
+def test_lattice_grid_method(im_path, pixel_size):
+    dir_name = os.path.dirname(os.path.realpath(__file__))
+    blot_config = BlotConfig(config=os.path.join(dir_name, '384_tiny_config.json'))
+    control_im, _ = open_rgb(im_path)
+
+    kmeans_blot = get_intensities(control_im, blot_config)
+
+    lattice_config = BlotConfig(config=dict(blot_config.config))
+    lattice_config.config['grid_method'] = 'lattice'
+    if pixel_size is not None:
+        lattice_config.config['pixel_size'] = pixel_size
+        lattice_blot = get_intensities(control_im, lattice_config)
+    else:
+        # without a pixel size, the pitch can't be used
+        with pytest.warns(UserWarning, match='pixel_size'):
+            lattice_blot = get_intensities(control_im, lattice_config)
+
+    assert lattice_blot.label_mapping == kmeans_blot.label_mapping
+    np.testing.assert_array_equal(lattice_blot.grid_coords, kmeans_blot.grid_coords)
+
+
+@pytest.mark.parametrize('coords,expected_indices', [
+    # empty grid positions are skipped
+    ([200, 201, 250, 400], [0, 0, 1, 4]),
+    # an off-lattice cluster (e.g., debris) does not move the lattice
+    ([174, 200, 200, 250, 250, 300, 300], [-1, 0, 0, 1, 1, 2, 2]),
+    # clusters past the end of the grid are rejected instead of clipped
+    ([50, 100, 150, 200, 250, 300, 350], [0, 1, 2, 3, 4, -1, -1]),
+])
+def test_find_indices_lattice_pitch(coords, expected_indices):
+    labels, indices = _find_indices_lattice(np.array(coords, dtype=float), n_indices=5, pitch=50)
+    np.testing.assert_array_equal(indices[labels], expected_indices)
+
+
+def test_fixed_grid_detection(im_path):
+    dir_name = os.path.dirname(os.path.realpath(__file__))
+    blot_config = BlotConfig(config=os.path.join(dir_name, '384_tiny_config.json'))
+    control_im, _ = open_rgb(im_path)
+
+    segmented_blot = get_intensities(control_im, blot_config)
+
+    grid_config = BlotConfig(config=dict(blot_config.config))
+    grid_config.config['detection_method'] = 'fixed_grid'
+    grid_config.config['pixel_size'] = 0.09
+    grid_blot = get_intensities(control_im, grid_config)
+
+    assert len(grid_blot.df) == blot_config.n_rows * blot_config.n_cols
+    merged = grid_blot.df.merge(segmented_blot.df, on='dot_name', suffixes=('_grid', '_segmented'))
+    assert np.all(np.abs(merged['x_grid'] - merged['x_segmented']) <= 1)
+    assert np.all(np.abs(merged['y_grid'] - merged['y_segmented']) <= 1)
+
+
+def test_find_spots_coarse_to_fine(im_path):
+    dir_name = os.path.dirname(os.path.realpath(__file__))
+    blot_config = BlotConfig(config=os.path.join(dir_name, '384_tiny_config.json'))
+    control_im, _ = open_rgb(im_path)
+
+    regions, _ = find_spots(control_im, blot_config.spot_params)
+    coarse_regions, coarse_label_im = find_spots(
+        control_im, dict(blot_config.spot_params, downsample=2)
+    )
+
+    assert coarse_label_im.shape == control_im.shape
+    assert len(coarse_regions) == len(regions)
+    # the spot boundaries are refined against the full resolution image
+    np.testing.assert_array_equal(coarse_regions['area'], regions['area'])
+    np.testing.assert_allclose(coarse_regions['mean_intensity'], regions['mean_intensity'])
+    np.testing.assert_allclose(coarse_regions['centroid-0'], regions['centroid-0'])
+    np.testing.assert_allclose(coarse_regions['centroid-1'], regions['centroid-1'])
+
+    for downsample in [1.5, 0, '2']:
+        spot_params = dict(blot_config.spot_params, downsample=downsample)
+        with pytest.raises(ValueError, match='downsample'):
+            find_spots(control_im, spot_params)
+        with pytest.raises(ValueError, match='downsample'):
+            BlotConfig(config=dict(blot_config.config, spot_params=spot_params))
+
+
+def test_release_images(im_path):
+    dir_name = os.path.dirname(os.path.realpath(__file__))
+    control_im, _ = open_rgb(im_path)
+    blot_data = get_intensities(control_im, os.path.join(dir_name, '384_tiny_config.json'))
+    assert blot_data.label_im.dtype == np.uint16
+
+    label_im = blot_data.label_im.copy()
+    blot_data.release_images()
+    assert blot_data.raw_im is None
+    np.testing.assert_array_equal(blot_data.label_im, label_im)
+
+    blot_data.release_images(labels='drop')
+    assert blot_data.label_im is None
+
+
+def test_mask_store(im_path, tmp_path):
+    dir_name = os.path.dirname(os.path.realpath(__file__))
+    blot_config_path = os.path.join(dir_name, '384_tiny_config.json')
+    assay_config_path = os.path.join(dir_name, 'assay_config.csv')
+    mask_store = MaskStore(str(tmp_path / 'masks'))
+
+    # the first quantification segments the strip and stores the mask
+    results = quantify_blot_array(
+        im_path, 'strip_0', blot_config_path, assay_config_path, mask_store=mask_store
+    )
+    assert 'strip_0' in mask_store
+    stored_results = quantify_blot_array(
+        im_path, 'strip_0', blot_config_path, assay_config_path, mask_store=mask_store
+    )
+    pd.testing.assert_frame_equal(stored_results, results)
+
+    # re-image the strip shifted and dimmer
+    im = io.imread(im_path)
+    shifted_im = np.zeros_like(im)
+    shifted_im[7:, :-12] = im[:-7, 12:] // 2
+    shifted_im_path = str(tmp_path / 'shifted_strip.tif')
+    io.imsave(shifted_im_path, shifted_im, check_contrast=False)
+
+    registered_results = quantify_blot_array(
+        shifted_im_path, 'strip_0', blot_config_path, assay_config_path,
+        mask_store=mask_store, register_mask=True
+    )
+    np.testing.assert_allclose(registered_results['x'], results['x'] - 12)
+    np.testing.assert_allclose(registered_results['y'], results['y'] + 7)
+    np.testing.assert_allclose(
+        registered_results['mean_intensity_control'], results['mean_intensity_control'] // 2
+    )
+
+    # a re-imaged strip with a different size is reported clearly
+    io.imsave(shifted_im_path, im[:-10], check_contrast=False)
+    for register_mask in [False, True]:
+        with pytest.raises(ValueError, match='stored mask of strip strip_0'):
+            quantify_blot_array(
+                shifted_im_path, 'strip_0', blot_config_path, assay_config_path,
+                mask_store=mask_store, register_mask=register_mask
+            )
+
+
+def test_mask_store_spots_translated_out(tmp_path):
+    dir_name = os.path.dirname(os.path.realpath(__file__))
+    label_im = np.zeros((100, 100), dtype=np.uint16)
+    label_im[10:20, 5:15] = 1
+    label_im[40:70, 50:70] = 2
+    blot_data = BlotData(
+        pd.DataFrame({
+            'dot_name': ['A1', 'A2'], 'blob_label': [1, 2], 'row': [0, 0], 'col': [0, 1],
+            'x': [9.5, 59.5], 'y': [14.5, 54.5], 'mean_intensity': [100.0, 100.0], 'area': [100, 600]
+        }),
+        label_im=label_im,
+        blot_config=BlotConfig(config=os.path.join(dir_name, '384_tiny_config.json')),
+        raw_im=(label_im > 0).astype(np.uint8) * 100,
+        label_mapping={1: 'A1', 2: 'A2'},
+        grid_coords=np.array([[0, 0], [0, 1]])
+    )
+    mask_store = MaskStore(str(tmp_path))
+    mask_store.save('strip_0', blot_data)
+
+    # shift the strip left so that A1 is out of the image
+    shifted_im = np.zeros_like(blot_data.raw_im)
+    shifted_im[:, :-20] = blot_data.raw_im[:, 20:]
+    with pytest.warns(UserWarning, match='1 spots of strip strip_0 were translated out of the image'):
+        registered_blot = mask_store.load('strip_0', blot_data.blot_config, im=shifted_im, register=True)
+
+    assert list(registered_blot.df['dot_name']) == ['A2']
+    assert registered_blot.label_mapping == {2: 'A2'}
+    np.testing.assert_array_equal(registered_blot.grid_coords, [[0, 1]])
+    np.testing.assert_allclose(registered_blot.df['x'], [39.5])
+
+    with pytest.raises(ValueError, match='stored mask of strip strip_0'):
+        mask_store.load('strip_0', blot_data.blot_config, im=shifted_im[:-10])
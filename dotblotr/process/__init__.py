@@ -1 +1,4 @@
-from .batch_strip_processing import process_im_list, process_dir
+from .batch_strip_processing import iter_process_im_list, process_im_list, process_dir
+from .result_cache import ResultCache
+from .file_discovery import find_images, default_strip_id
+from .results_store import ResultsStore
@@ -1,46 +1,440 @@
-import glob
-from typing import List
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple, Union
 import os
+import warnings
 
-from dotblotr.image import quantify_blot_array
+from dotblotr import BlotConfig, load_blot_config
+from dotblotr.analysis import call_hits
+from dotblotr.image import quantify_blot_array, load_assay_config, MaskStore
+from dotblotr.profiling import StageProfiler, activate_profiler, profile_stage
+from dotblotr.results_schema import apply_results_schema, concat_results
 import pandas as pd
 from tqdm import tqdm
 
+from .file_discovery import default_strip_id, find_images
+from .result_cache import ResultCache
+from .results_store import ResultsStore
+from .sinks import make_sink
+
+
+def _quantify_strip(
+        im_path: str,
+        strip_id: str,
+        blot_config: BlotConfig,
+        assay_config: pd.DataFrame,
+        assay_id: str,
+        control_channel: int,
+        probe_channels: Union[int, List[int]],
+        mask_store: Union[None, MaskStore] = None,
+        register_mask: bool = False
+) -> Tuple[Union[None, pd.DataFrame], Union[None, str]]:
+    """ Quantify a single strip, catching any error so that one bad
+    strip does not abort the batch. The hits are called afterwards by
+    _iter_strip_results(), so the cached results do not depend on them.
+
+    Returns
+    -------
+    result : Union[None, pd.DataFrame]
+        The assay results for the strip. None if processing failed.
+    error : Union[None, str]
+        Description of the error if processing failed, otherwise None.
+    """
+    try:
+        with profile_stage('quantify_strip', strip_id=strip_id):
+            result = quantify_blot_array(
+                im_path=im_path,
+                strip_id=strip_id,
+                array_config_path=blot_config,
+                assay_config_path=assay_config,
+                assay_id=assay_id,
+                control_channel=control_channel,
+                probe_channels=probe_channels,
+                hit_calling=False,
+                mask_store=mask_store,
+                register_mask=register_mask
+            )
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+    return result, None
+
+
+def _quantify_strip_profiled(profiler: StageProfiler, *args) -> Tuple[Tuple, List[dict]]:
+    """ Quantify a strip in a worker process with profiler active.
+    Returns the output of _quantify_strip() and the profiler records.
+    """
+    with profiler.activate():
+        result = _quantify_strip(*args)
+
+    return result, profiler.records
+
+
+def _cache_lookup(
+        cache: ResultCache, im_path: str, strip_id: str, assay_id: str, config_digest: str
+) -> Tuple[Union[None, str], Union[None, pd.DataFrame]]:
+    """ Look up a strip in the result cache.
+
+    Returns
+    -------
+    key : Union[None, str]
+        The cache key for the strip. None if the image could not be read.
+    result : Union[None, pd.DataFrame]
+        The cached results relabeled with strip_id and assay_id.
+        None if the strip is not in the cache.
+    """
+    try:
+        key = cache.key(im_path, config_digest)
+    except OSError:
+        return None, None
+
+    result = cache.get(key)
+    if result is not None:
+        result['assay_id'] = assay_id
+        result['strip_id'] = strip_id
+        # relabeling replaces the categorical columns with strings
+        result = apply_results_schema(result)
+
+    return key, result
+
+
+def _iter_strip_results(
+        strips: Iterable[Tuple[str, str]],
+        n_strips: Union[None, int],
+        blot_config_path: Union[str, BlotConfig],
+        assay_config_path: Union[str, pd.DataFrame],
+        n_workers: int,
+        assay_id: Union[None, str],
+        control_channel: int,
+        probe_channels: Union[int, List[int]],
+        output_path: Union[None, str, ResultsStore],
+        cache: Union[None, ResultCache],
+        hit_calling: bool,
+        profiler: Union[None, StageProfiler],
+        mask_store: Union[None, MaskStore],
+        register_mask: bool
+) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """ Quantify the (im_path, strip_id) pairs in strips, yielding the index in strips
+    and the results of each strip as soon as it is done. strips may be a lazy iterator,
+    in which case processing starts before it is exhausted.
+    n_strips is only used for the progress bar and may be None. Failed strips are
+    reported with a warning and skipped. If output_path is given, each result is also
+    appended to it. If cache is given, cached strips are not processed again, new
+    results are added to the cache and the cache is flushed at the end of the batch.
+    If hit_calling is True, the hits of each strip are called before it is written and
+    yielded. If profiler is given, the stages of each strip are recorded with it,
+    including those run in the worker processes.
+    mask_store and register_mask are passed to quantify_blot_array(). Strips that
+    are quantified with a stored mask are not added to the cache.
+    """
+    if assay_id is None:
+        if isinstance(assay_config_path, pd.DataFrame):
+            raise ValueError('assay_id must be given when the assay config is a DataFrame')
+        assay_id = os.path.split(assay_config_path)[-1]
+
+    # parse the configs once for the whole batch
+    blot_config = load_blot_config(blot_config_path)
+    assay_config = load_assay_config(assay_config_path)
+
+    sink = make_sink(output_path) if output_path is not None else None
+    if cache is not None:
+        config_digest = cache.config_digest(
+            blot_config, assay_config, control_channel, probe_channels,
+            mask_store_dir=mask_store.store_dir if mask_store is not None else None,
+            register_mask=register_mask
+        )
+    keys = {}
+    strip_ids = {}
+
+    def _lookup_strip(i, im_path, strip_id):
+        with profile_stage('cache_lookup', strip_id=strip_id):
+            keys[i], result = _cache_lookup(cache, im_path, strip_id, assay_id, config_digest)
+        if result is None and mask_store is not None and strip_id in mask_store:
+            # the results from a stored mask depend on the image it was segmented from,
+            # which is not part of the key, so they are not cached
+            keys[i] = None
+        return result
+
+    def _finish_strip(i, result, error, from_cache):
+        if error is not None:
+            warnings.warn('strip {} failed to process ({})'.format(strip_ids[i], error))
+            return None
+        if cache is not None and keys.get(i) is not None and not from_cache:
+            with profile_stage('cache_put', strip_id=strip_ids[i]):
+                cache.put(keys[i], result)
+        if hit_calling:
+            with profile_stage('call_hits', strip_id=strip_ids[i]):
+                result = call_hits(result)
+        if sink is not None:
+            with profile_stage('write_output', strip_id=strip_ids[i]):
+                sink.append(result)
+        return result
+
+    def _worker_result(future):
+        if profiler is None:
+            return future.result()
+        result, records = future.result()
+        profiler.extend(records)
+        return result
+
+    try:
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                # bound the strips in flight so that a long (or lazy) strips iterator
+                # is not submitted all at once and finished futures are released
+                max_in_flight = 2 * n_workers
+                futures = {}
+
+                def _parallel_results():
+                    strip_iter = enumerate(strips)
+                    strips_left = True
+                    while strips_left or futures:
+                        while strips_left and len(futures) < max_in_flight:
+                            try:
+                                i, (im_path, strip_id) = next(strip_iter)
+                            except StopIteration:
+                                strips_left = False
+                                break
+                            strip_ids[i] = strip_id
+                            if cache is not None:
+                                with activate_profiler(profiler):
+                                    result = _lookup_strip(i, im_path, strip_id)
+                                if result is not None:
+                                    yield i, (result, None), True
+                                    continue
+                            strip_args = (
+                                im_path, strip_id, blot_config, assay_config, assay_id, control_channel,
+                                probe_channels, mask_store, register_mask
+                            )
+                            if profiler is None:
+                                future = executor.submit(_quantify_strip, *strip_args)
+                            else:
+                                future = executor.submit(
+                                    _quantify_strip_profiled, profiler.new_worker_profiler(), *strip_args
+                                )
+                            futures[future] = i
+
+                        if futures:
+                            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                i = futures.pop(future)
+                                yield i, _worker_result(future), False
+
+                try:
+                    for i, (result, error), from_cache in tqdm(_parallel_results(), total=n_strips):
+                        with activate_profiler(profiler):
+                            result = _finish_strip(i, result, error, from_cache)
+                        if result is not None:
+                            yield i, result
+                finally:
+                    # don't start the remaining strips if the caller stops early
+                    for future in futures:
+                        future.cancel()
+        else:
+            # Run through each blot
+            for i, (im_path, strip_id) in enumerate(tqdm(strips, total=n_strips)):
+                strip_ids[i] = strip_id
+                with activate_profiler(profiler):
+                    result = None
+                    if cache is not None:
+                        result = _lookup_strip(i, im_path, strip_id)
+                    from_cache = result is not None
+                    if from_cache:
+                        error = None
+                    else:
+                        result, error = _quantify_strip(
+                            im_path, strip_id, blot_config, assay_config, assay_id,
+                            control_channel, probe_channels, mask_store, register_mask
+                        )
+                    result = _finish_strip(i, result, error, from_cache)
+                if result is not None:
+                    yield i, result
+    finally:
+        if sink is not None:
+            sink.close()
+        if cache is not None:
+            # write the image hashes once for the whole batch
+            cache.flush()
+
+
+def _concat_in_order(strip_results: Iterable[Tuple[int, pd.DataFrame]]) -> pd.DataFrame:
+    """ Concatenate the (index, results) pairs from _iter_strip_results() in index order """
+    assay_results = dict(strip_results)
+    if len(assay_results) == 0:
+        return pd.DataFrame()
+
+    results_table = concat_results([assay_results[i] for i in sorted(assay_results)])
+
+    return results_table
+
+
+def iter_process_im_list(
+        im_paths: List[str],
+        strip_ids: List[str],
+        blot_config_path: Union[str, BlotConfig],
+        assay_config_path: Union[str, pd.DataFrame],
+        n_workers: int = 1,
+        assay_id: Union[None, str] = None,
+        control_channel: int = 0,
+        probe_channels: Union[int, List[int]] = 1,
+        output_path: Union[None, str, ResultsStore] = None,
+        cache: Union[None, ResultCache] = None,
+        hit_calling: bool = True,
+        profiler: Union[None, StageProfiler] = None,
+        mask_store: Union[None, MaskStore] = None,
+        register_mask: bool = False
+) -> Iterator[pd.DataFrame]:
+    """ Quantify a list of strip images, yielding the results of each strip
+    as soon as it is done. This keeps memory bounded for long batches.
+    The parameters are the same as process_im_list().
+
+    Yields
+    ------
+    strip_results : pd.DataFrame
+        The assay results for one strip. With n_workers > 1, strips are
+        yielded in the order they finish. Strips that failed to process
+        are reported with a warning and skipped.
+    """
+    strip_results = _iter_strip_results(
+        zip(im_paths, strip_ids), len(strip_ids), blot_config_path, assay_config_path, n_workers=n_workers,
+        assay_id=assay_id, control_channel=control_channel, probe_channels=probe_channels,
+        output_path=output_path, cache=cache, hit_calling=hit_calling,
+        profiler=profiler, mask_store=mask_store, register_mask=register_mask
+    )
+    for _, result in strip_results:
+        yield result
+
 
 def process_im_list(
         im_paths: List[str],
         strip_ids: List[str],
-        blot_config_path: str,
-        assay_config_path: str
+        blot_config_path: Union[str, BlotConfig],
+        assay_config_path: Union[str, pd.DataFrame],
+        n_workers: int = 1,
+        assay_id: Union[None, str] = None,
+        control_channel: int = 0,
+        probe_channels: Union[int, List[int]] = 1,
+        output_path: Union[None, str, ResultsStore] = None,
+        cache: Union[None, ResultCache] = None,
+        hit_calling: bool = True,
+        profiler: Union[None, StageProfiler] = None,
+        mask_store: Union[None, MaskStore] = None,
+        register_mask: bool = False
 ) -> pd.DataFrame:
-    assay_results = []
-
-    # Run through each blot
-    for im_path, strip_id in tqdm(zip(im_paths, strip_ids), total=len(strip_ids)):
-        result = quantify_blot_array(
-            im_path=im_path,
-            strip_id=strip_id,
-            array_config_path=blot_config_path,
-            assay_config_path=assay_config_path
-        )
+    """ Quantify a list of strip images.
 
-        assay_results.append(result)
+    Parameters
+    ----------
+    im_paths : List[str]
+        Paths to the strip images.
+    strip_ids : List[str]
+        Identifier for each strip. Must be the same length as im_paths.
+    blot_config_path : Union[str, BlotConfig]
+        Path to the array config JSON or an already loaded BlotConfig.
+    assay_config_path : Union[str, pd.DataFrame]
+        Path to the assay config CSV or an already loaded assay config table.
+    n_workers : int
+        Number of worker processes to use. If 1, the strips are processed
+        serially in the current process. Default value is 1.
+    assay_id : Union[None, str]
+        Identifier for the assay. Defaults to the file name of the assay config.
+        Required if assay_config_path is a DataFrame.
+    control_channel : int
+        Index of the control channel used to segment the dots. Default is 0.
+    probe_channels : Union[int, List[int]]
+        Index or list of indices of the probe channels. Default is 1.
+    output_path : Union[None, str, ResultsStore]
+        Path to a .csv or .parquet file, or a ResultsStore. If given, the results
+        of each strip are written as soon as the strip is done, so the
+        finished strips are kept if the batch fails. Parquet requires pyarrow.
+    cache : Union[None, ResultCache]
+        If given, strips whose image and configs are unchanged since they were
+        cached are not processed again, and new results are added to the cache.
+    hit_calling : bool
+        If True, the hits are called for each strip. If False, only the control and probe
+        intensities are measured and the hits can be called for the whole batch
+        with dotblotr.analysis.call_hits(). Default value is True.
+    profiler : Union[None, StageProfiler]
+        If given, the wall time of each pipeline stage of each strip is recorded with it.
+        See dotblotr.profiling.StageProfiler.
+    mask_store : Union[None, MaskStore]
+        If given, strips with a stored mask (e.g., re-imaged strips with the same strip ID)
+        are measured with it instead of being segmented, and the masks of the
+        other strips are added to the store.
+    register_mask : bool
+        If True, the stored masks are translated to the new images before measuring.
+        Default value is False.
 
-    results_table = pd.concat(assay_results, axis=0, ignore_index=True)
+    Returns
+    -------
+    results_table : pd.DataFrame
+        The concatenated assay results for all strips in the order of im_paths.
+        Strips that failed to process are reported with a warning and omitted.
+    """
+    strip_results = _iter_strip_results(
+        zip(im_paths, strip_ids), len(strip_ids), blot_config_path, assay_config_path, n_workers=n_workers,
+        assay_id=assay_id, control_channel=control_channel, probe_channels=probe_channels,
+        output_path=output_path, cache=cache, hit_calling=hit_calling,
+        profiler=profiler, mask_store=mask_store, register_mask=register_mask
+    )
+    results_table = _concat_in_order(strip_results)
 
     return results_table
 
 
 def process_dir(
         dir_path:str,
-        blot_config_path:str,
-        assay_config_path:str,
-        filename_pattern: str = '*.tif'
+        blot_config_path: Union[str, BlotConfig],
+        assay_config_path: Union[str, pd.DataFrame],
+        filename_pattern: Union[str, Sequence[str]] = '*.tif',
+        n_workers: int = 1,
+        assay_id: Union[None, str] = None,
+        control_channel: int = 0,
+        probe_channels: Union[int, List[int]] = 1,
+        output_path: Union[None, str, ResultsStore] = None,
+        cache: Union[None, ResultCache] = None,
+        hit_calling: bool = True,
+        profiler: Union[None, StageProfiler] = None,
+        mask_store: Union[None, MaskStore] = None,
+        register_mask: bool = False,
+        recursive: bool = False,
+        exclude: Union[str, Sequence[str]] = (),
+        strip_id_func: Callable[[str], str] = default_strip_id
 ) -> pd.DataFrame:
+    """ Quantify the strip images in a directory. The directory is listed before
+    the worker processes are started, so no listing threads are running when they fork.
+
+    Parameters
+    ----------
+    dir_path : str
+        The directory containing the strip images.
+    filename_pattern : Union[str, Sequence[str]]
+        Glob pattern or list of patterns for the images to include.
+        Patterns containing a '/' are matched against the path relative to dir_path.
+        Default value is '*.tif'.
+    recursive : bool
+        If True, the images in subdirectories are included. Default value is False.
+    exclude : Union[str, Sequence[str]]
+        Glob pattern or list of patterns for the images and subdirectories to skip.
+    strip_id_func : Callable[[str], str]
+        Function that returns the strip ID for an image path.
+        Default is the file name up to the first '.'.
+
+    The other parameters are the same as process_im_list().
 
-    img_pattern = os.path.join(dir_path, filename_pattern)
-    im_paths = glob.glob(img_pattern)
-    strip_ids = [im.split(os.sep)[-1].split('.')[0] for im in im_paths]
-    results_table = process_im_list(im_paths, strip_ids, blot_config_path, assay_config_path)
+    Returns
+    -------
+    results_table : pd.DataFrame
+        The concatenated assay results for all strips, ordered by image path
+        (files of a directory by name, then each subdirectory in name order).
+    """
+    im_paths = list(find_images(dir_path, include=filename_pattern, exclude=exclude, recursive=recursive))
+    strips = ((im_path, strip_id_func(im_path)) for im_path in im_paths)
+    strip_results = _iter_strip_results(
+        strips, len(im_paths), blot_config_path, assay_config_path, n_workers=n_workers,
+        assay_id=assay_id, control_channel=control_channel, probe_channels=probe_channels,
+        output_path=output_path, cache=cache, hit_calling=hit_calling,
+        profiler=profiler, mask_store=mask_store, register_mask=register_mask
+    )
+    results_table = _concat_in_order(strip_results)
 
     return results_table
@@ -0,0 +1,98 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from fnmatch import fnmatch
+import os
+from typing import Iterator, List, Sequence, Tuple, Union
+
+
+def default_strip_id(im_path: str) -> str:
+    """ Get the strip ID from the image file name (the part before the first '.') """
+    return os.path.basename(im_path).split('.')[0]
+
+
+def _list_dir(dir_path: str) -> Tuple[List[str], List[str]]:
+    """ List the files and subdirectories of a directory, sorted by name.
+    Hidden entries (e.g., the ._ files macOS writes) are skipped, as glob does.
+    """
+    files = []
+    subdirs = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                files.append(entry.path)
+
+    return sorted(files), sorted(subdirs)
+
+
+def _matches(file_path: str, root: str, patterns: Sequence[str]) -> bool:
+    """ Check if a path matches any of the patterns. Patterns containing a '/' are
+    matched against the path relative to root and the others against the name.
+    """
+    name = os.path.basename(file_path)
+    rel_path = os.path.relpath(file_path, root).replace(os.sep, '/')
+
+    return any(fnmatch(rel_path if '/' in p else name, p) for p in patterns)
+
+
+def find_images(
+        dir_path: str,
+        include: Union[str, Sequence[str]] = '*.tif',
+        exclude: Union[str, Sequence[str]] = (),
+        recursive: bool = False,
+        n_threads: int = 4
+) -> Iterator[str]:
+    """ Find the images in a directory. Paths are yielded in a deterministic order:
+    the files of a directory sorted by name, followed by the contents of each
+    subdirectory in name order. Files and subdirectories starting with '.' are skipped.
+    When searching recursively, subdirectories are listed in parallel. The listing
+    threads have finished before the first path is yielded, so the consumer can
+    safely fork worker processes.
+
+    Parameters
+    ----------
+    dir_path : str
+        The directory to search.
+    include : Union[str, Sequence[str]]
+        Glob pattern or list of patterns for the files to include.
+        Default value is '*.tif'.
+    exclude : Union[str, Sequence[str]]
+        Glob pattern or list of patterns for the files and subdirectories to skip.
+    recursive : bool
+        If True, subdirectories are searched. Default value is False.
+    n_threads : int
+        Number of threads to list subdirectories with. Default value is 4.
+
+    Yields
+    ------
+    im_path : str
+        The path to each image.
+    """
+    if isinstance(include, str):
+        include = [include]
+    if isinstance(exclude, str):
+        exclude = [exclude]
+
+    def _walk(executor: ThreadPoolExecutor, listing: Future) -> Iterator[str]:
+        files, subdirs = listing.result()
+
+        # start listing the subdirectories before yielding the files
+        subdir_listings = []
+        if recursive:
+            subdir_listings = [
+                executor.submit(_list_dir, d) for d in subdirs if not _matches(d, dir_path, exclude)
+            ]
+
+        for f in files:
+            if _matches(f, dir_path, include) and not _matches(f, dir_path, exclude):
+                yield f
+
+        for subdir_listing in subdir_listings:
+            yield from _walk(executor, subdir_listing)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        im_paths = list(_walk(executor, executor.submit(_list_dir, dir_path)))
+
+    yield from im_paths
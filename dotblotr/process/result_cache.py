@@ -0,0 +1,234 @@
+from collections import OrderedDict
+import glob
+import hashlib
+import json
+import os
+from typing import List, Union
+
+import pandas as pd
+
+from dotblotr import BlotConfig
+
+CACHE_EXTENSION = '.parquet'
+# part of every key. Bump it when the measurements or the results schema change,
+# so results cached by an older version are not served.
+CACHE_VERSION = 3
+HASH_INDEX_FILE = 'file_hashes.json'
+
+
+def _hash_file(file_path: str, chunk_size: int = 2 ** 20) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+class ResultCache:
+    """ On-disk cache of per-strip results keyed on the contents of the strip image,
+    the array config, the assay config and the channels that were quantified.
+    Re-running a batch only processes the strips that are new or changed.
+
+    The hash of each image is remembered with its size and modification time,
+    so unchanged images are not re-read to find their key. The remembered hashes
+    are written to the cache directory by flush().
+
+    The results are stored as Parquet rather than pickles, so reading a cache
+    on a shared folder never runs code from it. Requires pyarrow.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory to store the cached results in. Created if it does not exist.
+    max_entries : Union[None, int]
+        Maximum number of results to keep. The least recently used results are
+        evicted first. If None, the number of results is not limited.
+    max_bytes : Union[None, int]
+        Maximum total size of the cached results in bytes. The least recently used
+        results are evicted first. If None, the size is not limited.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str,
+            max_entries: Union[None, int] = None,
+            max_bytes: Union[None, int] = None
+    ):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('pyarrow is required for the result cache: pip install pyarrow')
+
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._hash_index_path = os.path.join(cache_dir, HASH_INDEX_FILE)
+        if os.path.isfile(self._hash_index_path):
+            with open(self._hash_index_path, 'r') as f:
+                self._hash_index = json.load(f)
+        else:
+            self._hash_index = {}
+        self._hash_index_changed = False
+
+        # the size of each entry in least recently used order, loaded on the first eviction
+        self._entries = None
+        self._n_bytes = 0
+
+    def image_hash(self, im_path: str) -> str:
+        """ Get the content hash of an image, re-reading it only if it has changed """
+        im_path = os.path.abspath(im_path)
+        stat = os.stat(im_path)
+        file_info = self._hash_index.get(im_path)
+        if file_info is not None and file_info[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return file_info[2]
+
+        im_hash = _hash_file(im_path)
+        self._hash_index[im_path] = [stat.st_size, stat.st_mtime_ns, im_hash]
+        self._hash_index_changed = True
+
+        return im_hash
+
+    def config_digest(
+            self,
+            blot_config: BlotConfig,
+            assay_config: pd.DataFrame,
+            control_channel: int,
+            probe_channels: Union[int, List[int]],
+            mask_store_dir: Union[None, str] = None,
+            register_mask: bool = False
+    ) -> str:
+        """ Get the part of the key that is shared by all strips in a batch.
+        mask_store_dir and register_mask are the mask store settings of the batch, if any.
+        """
+        config_hash = hashlib.sha256()
+        config_hash.update(json.dumps(CACHE_VERSION).encode())
+        config_hash.update(json.dumps(blot_config.config, sort_keys=True).encode())
+        config_hash.update(json.dumps(list(assay_config.columns)).encode())
+        config_hash.update(pd.util.hash_pandas_object(assay_config, index=True).values.tobytes())
+        config_hash.update(json.dumps([control_channel, probe_channels]).encode())
+        if mask_store_dir is not None:
+            mask_settings = [os.path.abspath(mask_store_dir), register_mask]
+            config_hash.update(json.dumps(mask_settings).encode())
+
+        return config_hash.hexdigest()
+
+    def key(self, im_path: str, config_digest: str) -> str:
+        """ Get the cache key for a strip image and a config_digest() """
+        return '{}_{}'.format(self.image_hash(im_path), config_digest)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_EXTENSION)
+
+    def _entry_paths(self) -> List[str]:
+        return glob.glob(os.path.join(self.cache_dir, '*' + CACHE_EXTENSION))
+
+    def _has_limits(self) -> bool:
+        return self.max_entries is not None or self.max_bytes is not None
+
+    def _load_entries(self):
+        """ Scan the cache directory once for the entries and their sizes """
+        entries = []
+        for entry_path in self._entry_paths():
+            stat = os.stat(entry_path)
+            key = os.path.basename(entry_path)[:-len(CACHE_EXTENSION)]
+            entries.append((stat.st_mtime, key, stat.st_size))
+        entries.sort()
+
+        self._entries = OrderedDict((key, size) for _, key, size in entries)
+        self._n_bytes = sum(self._entries.values())
+
+    def get(self, key: str) -> Union[None, pd.DataFrame]:
+        """ Get the cached results for key. Returns None if they are not in the cache. """
+        entry_path = self._entry_path(key)
+        try:
+            result = pd.read_parquet(entry_path)
+        except (OSError, ValueError):
+            # missing, or partially written by an interrupted run
+            return None
+
+        # mark the entry as recently used
+        os.utime(entry_path)
+        if self._entries is not None and key in self._entries:
+            self._entries.move_to_end(key)
+
+        return result
+
+    def put(self, key: str, result: pd.DataFrame):
+        """ Store the results for key and evict old entries if the cache is full """
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path + '.tmp'
+        result.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, entry_path)
+
+        if not self._has_limits():
+            return
+        if self._entries is None:
+            # the scan includes the new entry
+            self._load_entries()
+        else:
+            size = os.path.getsize(entry_path)
+            self._n_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+
+        self.evict()
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is within its limits """
+        if not self._has_limits():
+            return
+        if self._entries is None:
+            self._load_entries()
+
+        while len(self._entries) > 0:
+            too_many = self.max_entries is not None and len(self._entries) > self.max_entries
+            too_big = self.max_bytes is not None and self._n_bytes > self.max_bytes
+            if not (too_many or too_big):
+                break
+            key, size = self._entries.popitem(last=False)
+            self._n_bytes -= size
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+
+    def flush(self):
+        """ Write the remembered image hashes to the cache directory if they have changed """
+        if not self._hash_index_changed:
+            return
+        tmp_path = self._hash_index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._hash_index, f)
+        os.replace(tmp_path, self._hash_index_path)
+        self._hash_index_changed = False
+
+    def close(self):
+        """ Flush the cache. The cache can still be used after it is closed. """
+        self.flush()
+
+    def invalidate(self, im_path: Union[None, str] = None):
+        """ Remove cached results.
+
+        Parameters
+        ----------
+        im_path : Union[None, str]
+            If given, only the results for this image (with any config) are removed.
+            Otherwise, all cached results are removed.
+        """
+        if im_path is None:
+            entry_paths = self._entry_paths()
+            self._hash_index = {}
+        else:
+            im_hash = self.image_hash(im_path)
+            entry_paths = glob.glob(os.path.join(self.cache_dir, im_hash + '_*' + CACHE_EXTENSION))
+            self._hash_index.pop(os.path.abspath(im_path), None)
+
+        for entry_path in entry_paths:
+            os.remove(entry_path)
+        # the entries are scanned again on the next eviction
+        self._entries = None
+
+        self._hash_index_changed = True
+        self.flush()
@@ -0,0 +1,107 @@
+from typing import List, Sequence, Union
+
+import pandas as pd
+
+PARTITION_COLS = ['assay_id', 'strip_id']
+CATEGORICAL_COLS = ['dot_name', 'strip_id']
+
+
+class ResultsStore:
+    """ Columnar on-disk store for results tables. Results are written as Parquet
+    partitioned by assay_id and strip_id (assay_id=<id>/strip_id=<id>/part-0.parquet),
+    so readers only load the columns and partitions they need.
+    dot_name and strip_id are read back as categoricals.
+
+    A ResultsStore can be passed as the output_path of process_dir() and
+    process_im_list() to write each strip as soon as it is done.
+    Writing a strip that is already in the store replaces it.
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    root_path : str
+        The directory of the store. Created on the first write.
+    """
+
+    def __init__(self, root_path: str):
+        try:
+            import pyarrow
+            import pyarrow.dataset
+        except ImportError:
+            raise ImportError('pyarrow is required for the results store: pip install pyarrow')
+        self._pa = pyarrow
+        self._ds = pyarrow.dataset
+
+        self.root_path = root_path
+        self._partitioning = self._ds.partitioning(
+            pyarrow.schema([(c, pyarrow.string()) for c in PARTITION_COLS]), flavor='hive'
+        )
+
+    def append(self, results_table: pd.DataFrame):
+        """ Write a results table to the store, replacing any strips it contains """
+        # partition values are stored in the directory names, the rest as dictionary encoded columns
+        results_table = results_table.astype({c: str for c in PARTITION_COLS})
+        results_table = results_table.astype(
+            {c: 'category' for c in CATEGORICAL_COLS if c not in PARTITION_COLS}
+        )
+        table = self._pa.Table.from_pandas(results_table, preserve_index=False)
+
+        self._ds.write_dataset(
+            table,
+            self.root_path,
+            format='parquet',
+            partitioning=self._partitioning,
+            existing_data_behavior='delete_matching'
+        )
+
+    def close(self):
+        pass
+
+    def _dataset(self):
+        return self._ds.dataset(self.root_path, format='parquet', partitioning=self._partitioning)
+
+    def read(
+            self,
+            columns: Union[None, Sequence[str]] = None,
+            assay_ids: Union[None, Sequence[str]] = None,
+            strip_ids: Union[None, Sequence[str]] = None
+    ) -> pd.DataFrame:
+        """ Read results from the store.
+
+        Parameters
+        ----------
+        columns : Union[None, Sequence[str]]
+            The columns to read. If None, all columns are read.
+        assay_ids : Union[None, Sequence[str]]
+            The assays to read. If None, all assays are read.
+        strip_ids : Union[None, Sequence[str]]
+            The strips to read. If None, all strips are read.
+
+        Returns
+        -------
+        results_table : pd.DataFrame
+            The selected results.
+        """
+        row_filter = None
+        for col, values in zip(PARTITION_COLS, [assay_ids, strip_ids]):
+            if values is None:
+                continue
+            col_filter = self._ds.field(col).isin(list(values))
+            row_filter = col_filter if row_filter is None else row_filter & col_filter
+
+        table = self._dataset().to_table(
+            columns=None if columns is None else list(columns), filter=row_filter
+        )
+        results_table = table.to_pandas()
+
+        categorical_cols = [c for c in CATEGORICAL_COLS if c in results_table.columns]
+        results_table = results_table.astype({c: 'category' for c in categorical_cols})
+
+        return results_table
+
+    def strip_ids(self, assay_id: Union[None, str] = None) -> List[str]:
+        """ Get the IDs of the strips in the store, optionally for one assay """
+        assay_ids = None if assay_id is None else [assay_id]
+        strip_ids = self.read(columns=['strip_id'], assay_ids=assay_ids)['strip_id']
+
+        return sorted(strip_ids.unique())
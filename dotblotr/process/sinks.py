@@ -0,0 +1,98 @@
+from os import path
+
+import pandas as pd
+
+from .results_store import ResultsStore
+
+
+class CsvSink:
+    """ Appends results tables to a CSV file. The file is overwritten on
+    the first append and every append is written to disk immediately,
+    so the strips written before a failure are kept.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the CSV file to write.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._n_appended = 0
+
+    def append(self, results_table: pd.DataFrame):
+        if self._n_appended == 0:
+            results_table.to_csv(self.file_path, mode='w', header=True, index=False)
+        else:
+            results_table.to_csv(self.file_path, mode='a', header=False, index=False)
+        self._n_appended += 1
+
+    def close(self):
+        pass
+
+
+class ParquetSink:
+    """ Appends results tables to a Parquet file, one row group per append.
+    The schema is set by the first table. The file footer is written by
+    close(), which the batch functions call even if processing fails.
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the Parquet file to write.
+    """
+
+    def __init__(self, file_path: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('pyarrow is required to write Parquet files: pip install pyarrow')
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+
+        self.file_path = file_path
+        self._writer = None
+
+    def append(self, results_table: pd.DataFrame):
+        if self._writer is None:
+            table = self._pa.Table.from_pandas(results_table, preserve_index=False)
+            self._writer = self._pq.ParquetWriter(self.file_path, table.schema)
+        else:
+            table = self._pa.Table.from_pandas(
+                results_table, schema=self._writer.schema, preserve_index=False
+            )
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def make_sink(file_path):
+    """ Make the sink for writing results tables to file_path.
+    The format is chosen from the file extension.
+
+    Parameters
+    ----------
+    file_path : Union[str, ResultsStore]
+        Path to the output file, which must end in .csv, .parquet or .pq,
+        or a ResultsStore, which is used as is.
+
+    Returns
+    -------
+    sink : Union[CsvSink, ParquetSink, ResultsStore]
+        The sink for the output file.
+    """
+    if isinstance(file_path, ResultsStore):
+        return file_path
+
+    extension = path.splitext(file_path)[-1].lower()
+    if extension == '.csv':
+        return CsvSink(file_path)
+    elif extension in ('.parquet', '.pq'):
+        return ParquetSink(file_path)
+    else:
+        raise ValueError('output file must be .csv, .parquet or .pq, got {}'.format(file_path))
@@ -0,0 +1,224 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dotblotr.image import MaskStore
+from dotblotr.process import (
+    batch_strip_processing, iter_process_im_list, process_im_list, ResultCache, ResultsStore
+)
+from dotblotr.process.result_cache import CACHE_EXTENSION
+from dotblotr.profiling import StageProfiler
+from dotblotr.test.utils import make_simulated_df
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+TEST_DIR = os.path.join(PACKAGE_DIR, 'image', 'test')
+
+
+@pytest.fixture
+def strip_dir(tmp_path, monkeypatch):
+    for f in ['384_tiny_config.json', 'assay_config.csv']:
+        shutil.copy(os.path.join(TEST_DIR, f), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    make_simulated_df(im_name='simulated_strip.tif')
+
+    return tmp_path
+
+
+def test_process_im_list_parallel(strip_dir):
+    im_path = str(strip_dir / 'simulated_strip.tif')
+    bad_path = str(strip_dir / 'missing.tif')
+    im_paths = [im_path, bad_path, im_path]
+    strip_ids = ['strip_0', 'bad_strip', 'strip_2']
+    blot_config_path = str(strip_dir / '384_tiny_config.json')
+    assay_config_path = str(strip_dir / 'assay_config.csv')
+
+    with pytest.warns(UserWarning, match='bad_strip'):
+        serial_results = process_im_list(
+            im_paths, strip_ids, blot_config_path, assay_config_path
+        )
+    with pytest.warns(UserWarning, match='bad_strip'):
+        parallel_results = process_im_list(
+            im_paths, strip_ids, blot_config_path, assay_config_path, n_workers=2
+        )
+
+    assert list(parallel_results['strip_id'].unique()) == ['strip_0', 'strip_2']
+    # the categorical columns stay categorical when the strips are concatenated
+    assert isinstance(parallel_results['strip_id'].dtype, pd.CategoricalDtype)
+    assert isinstance(parallel_results['dot_name'].dtype, pd.CategoricalDtype)
+    np.testing.assert_array_equal(
+        serial_results['norm_probe_intensity'].values,
+        parallel_results['norm_probe_intensity'].values
+    )
+
+
+def test_iter_process_im_list_parallel_streaming(strip_dir):
+    im_path = str(strip_dir / 'simulated_strip.tif')
+    blot_config_path = str(strip_dir / '384_tiny_config.json')
+    assay_config_path = str(strip_dir / 'assay_config.csv')
+    strip_ids = ['strip_{}'.format(i) for i in range(8)]
+    n_submitted = []
+
+    def im_paths():
+        for _ in strip_ids:
+            n_submitted.append(1)
+            yield im_path
+
+    # only 2 * n_workers strips are in flight when the first result is yielded
+    strip_results = iter_process_im_list(
+        im_paths(), strip_ids, blot_config_path, assay_config_path, n_workers=2
+    )
+    next(strip_results)
+    assert len(n_submitted) == 4
+    strip_results.close()
+
+    strip_results = list(
+        iter_process_im_list(
+            im_paths(), strip_ids, blot_config_path, assay_config_path, n_workers=2
+        )
+    )
+    assert sorted(r['strip_id'].iloc[0] for r in strip_results) == strip_ids
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.parquet'])
+def test_iter_process_im_list_output(strip_dir, extension):
+    if extension == '.parquet':
+        pytest.importorskip('pyarrow')
+    im_path = str(strip_dir / 'simulated_strip.tif')
+    blot_config_path = str(strip_dir / '384_tiny_config.json')
+    assay_config_path = str(strip_dir / 'assay_config.csv')
+    output_path = str(strip_dir / ('results' + extension))
+
+    strip_results = list(
+        iter_process_im_list(
+            [im_path, im_path], ['strip_0', 'strip_1'], blot_config_path, assay_config_path,
+            output_path=output_path
+        )
+    )
+    assert [r['strip_id'].iloc[0] for r in strip_results] == ['strip_0', 'strip_1']
+
+    if extension == '.csv':
+        saved_results = pd.read_csv(output_path)
+    else:
+        saved_results = pd.read_parquet(output_path)
+    assert len(saved_results) == sum(len(r) for r in strip_results)
+    np.testing.assert_allclose(
+        saved_results['norm_probe_intensity'],
+        pd.concat(strip_results)['norm_probe_intensity']
+    )
+
+
+def test_process_im_list_cache(strip_dir, monkeypatch):
+    pytest.importorskip('pyarrow')
+    im_path = str(strip_dir / 'simulated_strip.tif')
+    blot_config_path = str(strip_dir / '384_tiny_config.json')
+    assay_config_path = str(strip_dir / 'assay_config.csv')
+    cache = ResultCache(str(strip_dir / 'cache'), max_entries=1)
+
+    results = process_im_list(
+        [im_path], ['strip_0'], blot_config_path, assay_config_path, cache=cache
+    )
+
+    # cached strips are not processed again
+    def fail(*args, **kwargs):
+        raise RuntimeError('strip was reprocessed')
+    monkeypatch.setattr(batch_strip_processing, 'quantify_blot_array', fail)
+    cached_results = process_im_list(
+        [im_path], ['strip_1'], blot_config_path, assay_config_path, cache=cache
+    )
+    assert list(cached_results['strip_id'].unique()) == ['strip_1']
+    # cached strips are yielded with the same schema as processed strips
+    cached_strip_results = next(
+        iter_process_im_list([im_path], ['strip_1'], blot_config_path, assay_config_path, cache=cache)
+    )
+    pd.testing.assert_series_equal(cached_strip_results.dtypes.astype(str), results.dtypes.astype(str))
+    pd.testing.assert_frame_equal(
+        cached_results.drop(columns='strip_id'), results.drop(columns='strip_id')
+    )
+
+    cache.invalidate(im_path)
+    with pytest.warns(UserWarning, match='strip was reprocessed'):
+        process_im_list([im_path], ['strip_1'], blot_config_path, assay_config_path, cache=cache)
+
+
+def test_process_im_list_cache_mask_store(strip_dir):
+    pytest.importorskip('pyarrow')
+    im_path = str(strip_dir / 'simulated_strip.tif')
+    blot_config_path = str(strip_dir / '384_tiny_config.json')
+    assay_config_path = str(strip_dir / 'assay_config.csv')
+    cache = ResultCache(str(strip_dir / 'cache'))
+    mask_store = MaskStore(str(strip_dir / 'masks'))
+
+    def n_cached():
+        return len([f for f in os.listdir(cache.cache_dir) if f.endswith(CACHE_EXTENSION)])
+
+    process_im_list([im_path], ['strip_0'], blot_config_path, assay_config_path, cache=cache)
+    assert n_cached() == 1
+
+    # results with a mask store are cached under a different key
+    process_im_list(
+        [im_path], ['strip_0'], blot_config_path, assay_config_path, cache=cache, mask_store=mask_store
+    )
+    assert n_cached() == 2
+
+    # results from a stored mask are not cached
+    shutil.copy(im_path, str(strip_dir / 'reimaged_strip.tif'))
+    with open(str(strip_dir / 'reimaged_strip.tif'), 'ab') as f:
+        f.write(b'\0')
+    reimaged_results = process_im_list(
+        [str(strip_dir / 'reimaged_strip.tif')], ['strip_0'], blot_config_path, assay_config_path,
+        cache=cache, mask_store=mask_store
+    )
+    assert len(reimaged_results) > 0
+    assert n_cached() == 2
+
+
+def test_process_im_list_results_store(strip_dir):
+    pytest.importorskip('pyarrow')
+    im_path = str(strip_dir / 'simulated_strip.tif')
+    blot_config_path = str(strip_dir / '384_tiny_config.json')
+    assay_config_path = str(strip_dir / 'assay_config.csv')
+    store = ResultsStore(str(strip_dir / 'results'))
+
+    results = process_im_list(
+        [im_path, im_path], ['strip_0', 'strip_1'], blot_config_path, assay_config_path,
+        output_path=store
+    )
+    assert store.strip_ids() == ['strip_0', 'strip_1']
+
+    strip_results = store.read(columns=['dot_name', 'norm_probe_intensity'], strip_ids=['strip_1'])
+    assert list(strip_results.columns) == ['dot_name', 'norm_probe_intensity']
+    assert isinstance(strip_results['dot_name'].dtype, pd.CategoricalDtype)
+    np.testing.assert_allclose(
+        strip_results['norm_probe_intensity'],
+        results.loc[results['strip_id'] == 'strip_1', 'norm_probe_intensity']
+    )
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_process_im_list_profiler(strip_dir, n_workers):
+    im_path = str(strip_dir / 'simulated_strip.tif')
+    blot_config_path = str(strip_dir / '384_tiny_config.json')
+    assay_config_path = str(strip_dir / 'assay_config.csv')
+    profiler = StageProfiler(trace_memory=True)
+
+    process_im_list(
+        [im_path, im_path], ['strip_0', 'strip_1'], blot_config_path, assay_config_path,
+        n_workers=n_workers, profiler=profiler
+    )
+
+    records = profiler.to_dataframe()
+    for stage in ['quantify_strip', 'read_image', 'median_filter', 'regionprops', 'grid_mapping', 'call_hits']:
+        stage_records = records.loc[records['stage'] == stage]
+        assert sorted(stage_records['strip_id']) == ['strip_0', 'strip_1']
+    assert (records['duration'] > 0).all()
+    assert (records['peak_memory'] >= 0).all()
+
+    trace_path = str(strip_dir / 'trace.json')
+    profiler.to_chrome_trace(trace_path)
+    with open(trace_path) as f:
+        trace = json.load(f)
+    assert len(trace['traceEvents']) == len(records)
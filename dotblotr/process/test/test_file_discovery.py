@@ -0,0 +1,39 @@
+import os
+import threading
+
+from dotblotr.process import find_images
+
+
+def test_find_images(tmp_path):
+    for rel_path in [
+        'b.tif', 'a.tif', 'notes.txt', '._a.tif', '.hidden/h.tif',
+        'day_2/c.tif', 'day_1/e.tif', 'day_1/d.tif', 'day_1/qc/f.tif', 'skip/g.tif'
+    ]:
+        file_path = tmp_path / rel_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.touch()
+
+    def rel_paths(im_paths):
+        return [os.path.relpath(p, tmp_path).replace(os.sep, '/') for p in im_paths]
+
+    # hidden files and directories are skipped
+    assert rel_paths(find_images(str(tmp_path))) == ['a.tif', 'b.tif']
+
+    im_paths = find_images(str(tmp_path), recursive=True, exclude=['skip', 'day_1/qc'])
+    assert rel_paths(im_paths) == ['a.tif', 'b.tif', 'day_1/d.tif', 'day_1/e.tif', 'day_2/c.tif']
+
+    im_paths = find_images(str(tmp_path), include=['*.txt', 'day_2/*.tif'], recursive=True)
+    assert rel_paths(im_paths) == ['notes.txt', 'day_2/c.tif']
+
+
+def test_find_images_threads_finished(tmp_path):
+    for rel_path in ['a.tif', 'day_1/b.tif', 'day_2/c.tif']:
+        file_path = tmp_path / rel_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.touch()
+
+    # worker processes may be forked as soon as the first path is yielded
+    n_threads = threading.active_count()
+    im_paths = find_images(str(tmp_path), recursive=True)
+    next(im_paths)
+    assert threading.active_count() == n_threads
@@ -0,0 +1,55 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from dotblotr import BlotConfig
+from dotblotr.process import ResultCache, result_cache
+from dotblotr.process.result_cache import CACHE_EXTENSION, HASH_INDEX_FILE
+
+
+def test_result_cache_eviction(tmp_path):
+    pytest.importorskip('pyarrow')
+    cache = ResultCache(str(tmp_path), max_entries=2)
+    for i in range(3):
+        cache.put('key_{}'.format(i), pd.DataFrame({'a': [i]}))
+        if i == 1:
+            # key_0 becomes the most recently used entry
+            cache.get('key_0')
+
+    assert cache.get('key_1') is None
+    assert cache.get('key_0')['a'].iloc[0] == 0
+    assert cache.get('key_2')['a'].iloc[0] == 2
+
+    # a new cache over the same directory picks up the entries on disk
+    cache = ResultCache(str(tmp_path), max_entries=1)
+    cache.evict()
+    assert len([f for f in os.listdir(str(tmp_path)) if f.endswith(CACHE_EXTENSION)]) == 1
+
+
+def test_result_cache_version(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    blot_config = BlotConfig(config={'n_rows': 1, 'n_cols': 2})
+    assay_config = pd.DataFrame({'dot_name': ['A1', 'A2']})
+    cache = ResultCache(str(tmp_path))
+    config_digest = cache.config_digest(blot_config, assay_config, 0, 1)
+
+    # results cached by another version of the cache are not served
+    monkeypatch.setattr(result_cache, 'CACHE_VERSION', result_cache.CACHE_VERSION + 1)
+    assert cache.config_digest(blot_config, assay_config, 0, 1) != config_digest
+
+
+def test_result_cache_flush(tmp_path):
+    pytest.importorskip('pyarrow')
+    im_path = tmp_path / 'strip.tif'
+    im_path.write_bytes(b'strip')
+    cache = ResultCache(str(tmp_path / 'cache'))
+    im_hash = cache.image_hash(str(im_path))
+
+    # the image hashes are only written when the cache is flushed
+    hash_index_path = tmp_path / 'cache' / HASH_INDEX_FILE
+    assert not hash_index_path.exists()
+    cache.close()
+    with open(str(hash_index_path)) as f:
+        assert json.load(f)[str(im_path)][2] == im_hash
@@ -0,0 +1,174 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import os
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Union
+
+import pandas as pd
+
+_active_profiler = ContextVar('dotblotr_profiler', default=None)
+
+
+class _Frame:
+    """ A stage that is currently running """
+
+    def __init__(self, stage: str, strip_id: Union[None, str], start_memory: int):
+        self.stage = stage
+        self.strip_id = strip_id
+        self.start_memory = start_memory
+        self.peak_memory = start_memory
+
+
+class StageProfiler:
+    """ Records the wall time (and optionally the peak memory) of the pipeline stages.
+    Profiling is opt-in: the stages are only recorded while a profiler is active.
+
+    A profiler can be passed to process_dir(), process_im_list() and iter_process_im_list(),
+    which record the stages of every strip, including those processed in worker processes.
+    To profile other code, activate the profiler:
+
+        profiler = StageProfiler()
+        with profiler.activate():
+            quantify_blot_array(...)
+        profiler.summary()
+
+    Parameters
+    ----------
+    trace_memory : bool
+        If True, the peak memory allocated in each stage is recorded with tracemalloc.
+        This slows down the pipeline, so it is off by default.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._stack = []
+
+    def new_worker_profiler(self) -> 'StageProfiler':
+        """ Make an empty profiler with the same settings to send to a worker process """
+        return StageProfiler(trace_memory=self.trace_memory)
+
+    @contextmanager
+    def activate(self):
+        """ Record the stages run in this context with this profiler """
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        token = _active_profiler.set(self)
+        try:
+            yield self
+        finally:
+            _active_profiler.reset(token)
+            if started_tracing:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, stage: str, strip_id: Union[None, str] = None):
+        """ Record a stage. Nested stages inherit the strip_id of the enclosing stage. """
+        if strip_id is None and len(self._stack) > 0:
+            strip_id = self._stack[-1].strip_id
+
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # fold the peak so far into the running stages before resetting it
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            for frame in self._stack:
+                frame.peak_memory = max(frame.peak_memory, peak_memory)
+            tracemalloc.reset_peak()
+        else:
+            current_memory = 0
+
+        frame = _Frame(stage, strip_id, current_memory)
+        self._stack.append(frame)
+        start_time = time.time()
+        start_counter = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start_counter
+            self._stack.pop()
+
+            record = {
+                'stage': stage,
+                'strip_id': strip_id,
+                'depth': len(self._stack),
+                'start': start_time,
+                'duration': duration,
+                'pid': os.getpid()
+            }
+            if tracing:
+                frame.peak_memory = max(frame.peak_memory, tracemalloc.get_traced_memory()[1])
+                record['peak_memory'] = frame.peak_memory - frame.start_memory
+                if len(self._stack) > 0:
+                    parent = self._stack[-1]
+                    parent.peak_memory = max(parent.peak_memory, frame.peak_memory)
+            self.records.append(record)
+
+    def extend(self, records: List[Dict]):
+        """ Add the records from another profiler, e.g., one that ran in a worker process """
+        self.records.extend(records)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """ Get the records as a table with one row per stage per strip.
+        duration is in seconds and peak_memory (if traced) is in bytes.
+        """
+        return pd.DataFrame(self.records)
+
+    def summary(self) -> pd.DataFrame:
+        """ Get the number of calls and the total, mean and max duration of each stage,
+        sorted by the total duration.
+        """
+        records = self.to_dataframe()
+        if len(records) == 0:
+            return pd.DataFrame()
+
+        summary = records.groupby('stage')['duration'].agg(['count', 'sum', 'mean', 'max'])
+        if 'peak_memory' in records.columns:
+            summary['max_peak_memory'] = records.groupby('stage')['peak_memory'].max()
+
+        return summary.sort_values('sum', ascending=False)
+
+    def to_chrome_trace(self, file_path: str):
+        """ Save the records as a Chrome trace JSON file, which can be opened
+        in chrome://tracing or https://ui.perfetto.dev
+        """
+        events = []
+        for record in self.records:
+            args = {'strip_id': record['strip_id']}
+            if 'peak_memory' in record:
+                args['peak_memory'] = record['peak_memory']
+            events.append({
+                'name': record['stage'],
+                'ph': 'X',
+                'ts': record['start'] * 1e6,
+                'dur': record['duration'] * 1e6,
+                'pid': record['pid'],
+                'tid': record['pid'],
+                'args': args
+            })
+
+        with open(file_path, 'w') as f:
+            json.dump({'traceEvents': events}, f)
+
+
+@contextmanager
+def profile_stage(stage: str, strip_id: Union[None, str] = None) -> Iterator[None]:
+    """ Record a pipeline stage with the active StageProfiler. Does nothing if no profiler is active. """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield
+    else:
+        with profiler.stage(stage, strip_id=strip_id):
+            yield
+
+
+@contextmanager
+def activate_profiler(profiler: Union[None, StageProfiler]) -> Iterator[None]:
+    """ Activate profiler if it is not None """
+    if profiler is None:
+        yield
+    else:
+        with profiler.activate():
+            yield
@@ -0,0 +1,92 @@
+from typing import List
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# string columns that repeat on every row are stored as categoricals
+CATEGORICAL_COLS = [
+    'assay_id',
+    'strip_id',
+    'dot_name',
+    'source_plate_id',
+    'source_plate_row',
+    'exp_group'
+]
+
+# narrowed numeric columns. The intensities and thresholds are kept as float64
+# so the hit calls are the same as with the full precision table.
+NUMERIC_DTYPES = {
+    'channel': 'uint8',
+    'blob_label': 'int32',
+    'row': 'int16',
+    'col': 'int16',
+    'x': 'float32',
+    'y': 'float32',
+    'area': 'int32'
+}
+
+# narrowed columns from the user supplied assay config. They are nullable, so empty
+# cells are kept, and they are left as is if they can't be cast without loss.
+ASSAY_CONFIG_DTYPES = {
+    'source_plate_column': 'Int16'
+}
+
+
+def apply_results_schema(results_table: pd.DataFrame) -> pd.DataFrame:
+    """ Cast the columns of a results table to the results schema.
+    Columns that are not in the table or not in the schema are left as is,
+    as are assay config columns that can't be cast without loss.
+
+    Parameters
+    ----------
+    results_table : pd.DataFrame
+        The results table from quantify_blot_array() or process_dir().
+
+    Returns
+    -------
+    results_table : pd.DataFrame
+        The results table with categorical string columns and narrowed numeric columns.
+    """
+    dtypes = {c: 'category' for c in CATEGORICAL_COLS if c in results_table.columns}
+    dtypes.update({c: t for c, t in NUMERIC_DTYPES.items() if c in results_table.columns})
+
+    results_table = results_table.astype(dtypes)
+
+    for col, dtype in ASSAY_CONFIG_DTYPES.items():
+        if col in results_table.columns:
+            try:
+                results_table[col] = results_table[col].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+
+    return results_table
+
+
+def concat_results(results_tables: List[pd.DataFrame]) -> pd.DataFrame:
+    """ Concatenate results tables, keeping the schema. The categories of each
+    categorical column are the union of the categories in all tables, so the
+    columns stay categorical instead of falling back to object.
+
+    Parameters
+    ----------
+    results_tables : List[pd.DataFrame]
+        The results tables to concatenate.
+
+    Returns
+    -------
+    results_table : pd.DataFrame
+        The concatenated results table.
+    """
+    results_tables = [apply_results_schema(t) for t in results_tables]
+
+    categorical_cols = [c for c in CATEGORICAL_COLS if c in results_tables[0].columns]
+    for col in categorical_cols:
+        categories = union_categoricals(
+            [t[col] for t in results_tables if col in t.columns], ignore_order=True
+        ).categories
+        dtype = pd.CategoricalDtype(categories)
+        results_tables = [
+            t.astype({col: dtype}) if col in t.columns else t for t in results_tables
+        ]
+
+    return pd.concat(results_tables, axis=0, ignore_index=True)
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from dotblotr.results_schema import apply_results_schema
+
+
+def test_apply_results_schema_assay_config_columns():
+    results_table = pd.DataFrame({'dot_name': ['A1', 'A2'], 'source_plate_column': [1, np.nan]})
+    results_table = apply_results_schema(results_table)
+    # empty cells are kept in the nullable integer column
+    assert results_table['source_plate_column'].dtype == 'Int16'
+    assert results_table['source_plate_column'].isna().tolist() == [False, True]
+
+    # columns that can't be narrowed without loss are left as is
+    for source_plate_column in [[1.5, 2], ['1a', '2a'], [40000, 1]]:
+        results_table = pd.DataFrame({'dot_name': ['A1', 'A2'], 'source_plate_column': source_plate_column})
+        pd.testing.assert_series_equal(
+            apply_results_schema(results_table)['source_plate_column'], results_table['source_plate_column']
+        )
@@ -1,4 +1,6 @@
 import json
+import string
+from typing import List, Tuple, Union
 
 import cv2
 from matplotlib import pyplot as plt
@@ -16,6 +18,23 @@ ROW_OFFSET = 50
 COL_PITCH = 50
 COL_OFFSET = 50
 
+# spot_params for dots drawn with DOT_SIZE at ROW_PITCH
+SPOT_PARAMS = {
+    'med_filt_size': 7,
+    'block_size': 101,
+    'closing_size': 11,
+    'erosion_size': 10,
+    'min_area': 100,
+    'circ_thresh': 0.3
+}
+
+# plate layouts (n_rows, n_cols) by number of wells
+PLATE_LAYOUTS = {
+    96: (8, 12),
+    384: (16, 24),
+    1536: (32, 48)
+}
+
 
 def _make_intensity(row):
     if row['exp_group'] == 'neg':
@@ -28,23 +47,163 @@ def _make_intensity(row):
     return dot_intensity
 
 
-def make_simulated_df(im_name: str = 'simulated_strip.tif'):
-    """ Make a simulated image of a strip. The control image is in
-    channel 1 and the probe images is in channel 2.
+def make_row_labels(n_rows: int) -> List[str]:
+    """ Make plate row labels: A-Z, then AA, AB, ... """
+    letters = string.ascii_uppercase
+    return [
+        letters[r] if r < len(letters) else letters[r // len(letters) - 1] + letters[r % len(letters)]
+        for r in range(n_rows)
+    ]
+
+
+def make_array_config(n_rows: int = 16, n_cols: int = 24, pitch: int = ROW_PITCH) -> dict:
+    """ Make an array config for a simulated strip.
 
     Parameters:
     -----------
-    im_name : str
-        the file name of the simulated image
+    n_rows : int
+        the number of rows of dots
+    n_cols : int
+        the number of columns of dots
+    pitch : int
+        the distance between dots in pixels. The spot_params are scaled
+        from those for ROW_PITCH.
+
+    Returns:
+    --------
+    array_config : dict
+        the array config. The pitches are in pixels (pixel_size is 1).
+    """
+    scale = pitch / ROW_PITCH
+    spot_params = dict(SPOT_PARAMS)
+    spot_params['med_filt_size'] = max(1, int(round(SPOT_PARAMS['med_filt_size'] * scale)))
+    spot_params['closing_size'] = max(1, int(round(SPOT_PARAMS['closing_size'] * scale)))
+    spot_params['erosion_size'] = int(round(SPOT_PARAMS['erosion_size'] * scale))
+    spot_params['min_area'] = SPOT_PARAMS['min_area'] * scale ** 2
+
+    array_config = {
+        'name': '{}Plate'.format(n_rows * n_cols),
+        'n_rows': n_rows,
+        'n_cols': n_cols,
+        'row_labels': make_row_labels(n_rows),
+        'col_labels': [str(c + 1) for c in range(n_cols)],
+        'row_pitch': pitch,
+        'col_pitch': pitch,
+        'pixel_size': 1.0,
+        'spot_params': spot_params
+    }
+
+    return array_config
+
+
+def make_assay_config(
+        array_config: dict,
+        n_neg: int = 6,
+        n_empty: int = 2,
+        source_plate_id: str = 'plate_1',
+        zscore_threshold: float = 3
+) -> pd.DataFrame:
+    """ Make an assay config for a simulated strip. The first n_neg dots are negative
+    controls, the last n_empty dots are empty and the others are experimental.
+
+    Parameters:
+    -----------
+    array_config : dict
+        the array config from make_array_config()
+    n_neg : int
+        the number of negative control dots
+    n_empty : int
+        the number of empty dots
+    source_plate_id : str
+        the source plate ID of every dot
+    zscore_threshold : float
+        the zscore_threshold of every dot
+
+    Returns:
+    --------
+    assay_config : pd.DataFrame
+        the assay config
     """
-    # load assay config
-    with open('384_tiny_config.json') as json_file:
-        assay_config = json.load(json_file)
+    row_labels = array_config['row_labels']
+    col_labels = array_config['col_labels']
+    source_plate_rows = [r for r in row_labels for _ in col_labels]
+    source_plate_cols = [int(c) for _ in row_labels for c in col_labels]
+    n_dots = len(source_plate_rows)
 
-    n_rows = assay_config['n_rows']
-    n_cols = assay_config['n_cols']
-    row_labels = assay_config['row_labels']
-    col_labels = assay_config['col_labels']
+    exp_group = np.array(['exp'] * n_dots, dtype=object)
+    exp_group[:n_neg] = 'neg'
+    if n_empty > 0:
+        exp_group[-n_empty:] = 'empty'
+
+    assay_config = pd.DataFrame({
+        'dot_name': [r + str(c) for r, c in zip(source_plate_rows, source_plate_cols)],
+        'source_plate_id': source_plate_id,
+        'source_plate_row': source_plate_rows,
+        'source_plate_column': source_plate_cols,
+        'exp_group': exp_group,
+        'zscore_threshold': zscore_threshold
+    })
+
+    return assay_config
+
+
+def make_strip_image(
+        array_config: dict,
+        assay_config: pd.DataFrame,
+        im_shape: Union[None, Tuple[int, int]] = None,
+        dot_size: Union[None, int] = None,
+        noise: float = 0,
+        n_debris: int = 0,
+        seed: int = 0
+) -> np.ndarray:
+    """ Make a simulated RGB strip image. The control dots are in channel 1 and
+    the probe dots are in channel 2. The dots are drawn at the pitch of the array
+    config, starting one pitch from the top left corner.
+
+    Parameters:
+    -----------
+    array_config : dict
+        the array config (see make_array_config())
+    assay_config : pd.DataFrame
+        the assay config. The probe intensity of each dot is drawn at random
+        from its exp_group.
+    im_shape : Union[None, Tuple[int, int]]
+        the (height, width) of the image. If None, the image fits the array
+        with a one pitch margin.
+    dot_size : Union[None, int]
+        the dot radius in pixels. If None, it is scaled from DOT_SIZE by the pitch.
+    noise : float
+        the standard deviation of the Gaussian noise added to the image
+    n_debris : int
+        the number of small bright debris blobs to add
+    seed : int
+        the random seed for the dot intensities, noise and debris
+
+    Returns:
+    --------
+    simulated_strip : np.ndarray
+        the (height, width, 3) uint8 image
+    """
+    n_rows = array_config['n_rows']
+    n_cols = array_config['n_cols']
+    row_labels = array_config['row_labels']
+    col_labels = array_config['col_labels']
+    row_pitch = array_config.get('row_pitch', ROW_PITCH)
+    col_pitch = array_config.get('col_pitch', COL_PITCH)
+    if array_config.get('pixel_size') is None:
+        # the pitches of the configs without a pixel size are not in pixels
+        row_pitch = ROW_PITCH
+        col_pitch = COL_PITCH
+    row_offset = row_pitch * ROW_OFFSET / ROW_PITCH
+    col_offset = col_pitch * COL_OFFSET / COL_PITCH
+    if dot_size is None:
+        dot_size = DOT_SIZE * min(row_pitch, col_pitch) / ROW_PITCH
+    if im_shape is None:
+        im_shape = (
+            int(2 * row_offset + row_pitch * (n_rows - 1)),
+            int(2 * col_offset + col_pitch * (n_cols - 1))
+        )
+    im_height, im_width = im_shape
 
     dot_names = {}
     n_dots = n_rows * n_cols
@@ -52,40 +211,90 @@ def make_simulated_df(im_name: str = 'simulated_strip.tif'):
     i = 0
     for r in range(n_rows):
         for c in range(n_cols):
-            x_coord = COL_OFFSET + (COL_PITCH * c)
-            y_coord = ROW_OFFSET + (ROW_PITCH * r)
+            x_coord = col_offset + (col_pitch * c)
+            y_coord = row_offset + (row_pitch * r)
             nominal_dot_coords[i, :] = [x_coord, y_coord]
 
             dot_name = row_labels[r] + col_labels[c]
             dot_names[dot_name] = i
             i += 1
 
-    nominal_dot_coords = np.array(nominal_dot_coords)
-
-    # load the assay config
-    assay_config = pd.read_csv('assay_config.csv')
-
     # make intensities for each dot
-    np.random.seed(0)
-    assay_config['dot_intensity'] = assay_config.apply(_make_intensity, axis=1)
+    np.random.seed(seed)
+    intensities = assay_config.apply(_make_intensity, axis=1).astype('uint8').values
 
     # get the coordinates of the dots in the assay
     assay_dot_names = assay_config['dot_name'].values
     assay_coords = np.array([nominal_dot_coords[dot_names[n]] for n in assay_dot_names])
 
-    intensities = assay_config['dot_intensity'].astype('uint8').values
-
     # make the probe dots for the simulated image
-    probe_im = np.zeros((IM_HEIGHT, IM_WIDTH, 3), dtype='uint8')
+    probe_im = np.zeros((im_height, im_width, 3), dtype='uint8')
     for intensity, coord in zip(intensities, assay_coords):
         dot_intensity = tuple([int(0), int(intensity), int(0)])
-        cv2.circle(probe_im, (int(coord[0]), int(coord[1])), int(DOT_SIZE), dot_intensity, cv2.FILLED)
+        cv2.circle(probe_im, (int(coord[0]), int(coord[1])), int(dot_size), dot_intensity, cv2.FILLED)
 
-    control_im = np.zeros((IM_HEIGHT, IM_WIDTH, 3), dtype='uint8')
+    control_im = np.zeros((im_height, im_width, 3), dtype='uint8')
     for coord in assay_coords:
         dot_intensity = tuple([int(CONTROL_INTENSITY), int(0), int(0)])
-        cv2.circle(control_im, (int(coord[0]), int(coord[1])), int(DOT_SIZE), dot_intensity, cv2.FILLED)
+        cv2.circle(control_im, (int(coord[0]), int(coord[1])), int(dot_size), dot_intensity, cv2.FILLED)
 
     simulated_strip = control_im + probe_im
 
+    rng = np.random.RandomState(seed)
+    debris_x = rng.randint(0, im_width, size=n_debris)
+    debris_y = rng.randint(0, im_height, size=n_debris)
+    for x, y in zip(debris_x, debris_y):
+        debris_intensity = (CONTROL_INTENSITY, int(rng.randint(50, 110)), 0)
+        cv2.circle(simulated_strip, (int(x), int(y)), int(rng.randint(1, 4)), debris_intensity, cv2.FILLED)
+
+    if noise > 0:
+        noisy_strip = simulated_strip + rng.normal(0, noise, size=simulated_strip.shape)
+        simulated_strip = np.clip(np.round(noisy_strip), 0, 255).astype('uint8')
+
+    return simulated_strip
+
+
+def make_simulated_df(
+        im_name: str = 'simulated_strip.tif',
+        array_config_path: str = '384_tiny_config.json',
+        assay_config_path: str = 'assay_config.csv',
+        im_shape: Tuple[int, int] = (IM_HEIGHT, IM_WIDTH),
+        noise: float = 0,
+        n_debris: int = 0,
+        seed: int = 0
+):
+    """ Make a simulated image of a strip. The control image is in
+    channel 1 and the probe images is in channel 2.
+
+    Parameters:
+    -----------
+    im_name : str
+        the file name of the simulated image
+    array_config_path : str
+        the path to the array config. Default is 384_tiny_config.json
+        in the working directory.
+    assay_config_path : str
+        the path to the assay config. Default is assay_config.csv
+        in the working directory.
+    im_shape : Tuple[int, int]
+        the (height, width) of the image
+    noise : float
+        the standard deviation of the Gaussian noise added to the image
+    n_debris : int
+        the number of small bright debris blobs to add
+    seed : int
+        the random seed for the dot intensities, noise and debris
+    """
+    # load the array config
+    with open(array_config_path) as json_file:
+        array_config = json.load(json_file)
+
+    # load the assay config
+    assay_config = pd.read_csv(assay_config_path)
+
+    simulated_strip = make_strip_image(
+        array_config, assay_config, im_shape=im_shape, dot_size=DOT_SIZE,
+        noise=noise, n_debris=n_debris, seed=seed
+    )
+
     io.imsave(im_name, simulated_strip)
@@ -1,3 +1,3 @@
 from .dot_arrays import plot_zscore, plot_value, plot_hit_counts
 from .scatter import plot_hit_grid, plot_cplot
-from .qc import plot_detected_dots
+from .qc import plot_detected_dots, export_qc_images
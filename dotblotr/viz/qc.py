@@ -1,13 +1,64 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
 from os import path
-from typing import Tuple
+from typing import Dict, List, Sequence, Tuple, Union
+import warnings
 
 import cv2
 import matplotlib
 from matplotlib import pyplot as plt
+import numpy as np
 import pandas as pd
 from skimage import io
 
 
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+LINE_TYPE = cv2.LINE_AA
+
+
+def _text_sizes(dot_names, font_scale: float, line_thickness: int) -> Dict[str, Tuple[int, int]]:
+    """ Get the (width, height) of the label of each dot name """
+    text_sizes = {}
+    for dot_name in dot_names:
+        text_size, baseline = cv2.getTextSize(
+            text=str(dot_name),
+            fontFace=FONT,
+            fontScale=font_scale,
+            thickness=line_thickness
+        )
+        text_sizes[dot_name] = text_size
+
+    return text_sizes
+
+
+def _draw_dot_names(
+        im: np.ndarray,
+        dot_names: Sequence[str],
+        x_coords: Sequence[float],
+        y_coords: Sequence[float],
+        text_sizes: Dict[str, Tuple[int, int]],
+        font_scale: float,
+        font_color: Tuple[int, int, int],
+        line_thickness: int
+):
+    """ Draw the dot names centered on the dots, in place """
+    for dot_name, x, y in zip(dot_names, x_coords, y_coords):
+        text_size = text_sizes[dot_name]
+        x_centered = int(x - (text_size[0] / 2))
+        y_centered = int(y + (text_size[1] / 2))
+
+        cv2.putText(
+            img=im,
+            text=str(dot_name),
+            org=(x_centered, y_centered),
+            fontFace=FONT,
+            fontScale=font_scale,
+            color=font_color,
+            lineType=LINE_TYPE,
+            thickness=line_thickness
+        )
+
+
 def plot_detected_dots(
         results_table:pd.DataFrame,
         strip_id:str,
@@ -54,35 +105,152 @@ def plot_detected_dots(
 
     strip_results = results_table.loc[results_table['strip_id'] == strip_id]
 
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    line_type = cv2.LINE_AA
+    text_sizes = _text_sizes(strip_results['dot_name'].unique(), font_scale, line_thickness)
+    _draw_dot_names(
+        im=im,
+        dot_names=strip_results['dot_name'].values,
+        x_coords=strip_results['x'].values,
+        y_coords=strip_results['y'].values,
+        text_sizes=text_sizes,
+        font_scale=font_scale,
+        font_color=font_color,
+        line_thickness=line_thickness
+    )
 
-    for i, row in strip_results.iterrows():
-        well_name = row['dot_name']
-        x = row['x']
-        y = row['y']
-        text_size, baseline = cv2.getTextSize(
-            text=well_name,
-            fontFace=font,
-            fontScale=font_scale,
-            thickness=line_thickness
+    f, ax = plt.subplots(figsize=(15, 12))
+    ax.imshow(im)
+
+    return f, ax
+
+
+def _export_strip(
+        image_path: str,
+        output_path: str,
+        dot_names: np.ndarray,
+        x_coords: np.ndarray,
+        y_coords: np.ndarray,
+        text_sizes: Dict[str, Tuple[int, int]],
+        scale: float,
+        font_scale: float,
+        font_color: Tuple[int, int, int],
+        line_thickness: int
+) -> Union[None, str]:
+    """ Write the QC image for one strip.
+    Returns a description of the error if the strip failed, otherwise None.
+    """
+    try:
+        im = io.imread(image_path)
+        if scale != 1:
+            im = cv2.resize(im, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if im.ndim == 3:
+            # OpenCV writes BGR
+            im = np.ascontiguousarray(im[..., 2::-1])
+            font_color = font_color[::-1]
+
+        _draw_dot_names(
+            im=im,
+            dot_names=dot_names,
+            x_coords=x_coords * scale,
+            y_coords=y_coords * scale,
+            text_sizes=text_sizes,
+            font_scale=font_scale,
+            font_color=font_color,
+            line_thickness=line_thickness
         )
+        if not cv2.imwrite(output_path, im):
+            raise IOError('could not write {}'.format(output_path))
+    except Exception as e:
+        return '{}: {}'.format(type(e).__name__, e)
 
-        x_centered = int(x - (text_size[0] / 2))
-        y_centered = int(y + (text_size[1] / 2))
+    return None
 
-        cv2.putText(
-            img=im,
-            text=well_name,
-            org=(x_centered, y_centered),
-            fontFace=font,
-            fontScale=font_scale,
-            color=font_color,
-            lineType=line_type,
-            thickness=line_thickness
+
+def export_qc_images(
+        results_table: pd.DataFrame,
+        image_directory: str,
+        output_directory: str,
+        image_extension: str = '.tif',
+        output_extension: str = '.png',
+        scale: float = 1,
+        font_scale: float = 1,
+        font_color: Tuple[int, int, int] = (255, 255, 255),
+        line_thickness: int = 2,
+        n_workers: int = 1
+) -> List[str]:
+    """ Write an image of each strip with the detected dot labels overlaid,
+    as in plot_detected_dots(), for all strips in a results table.
+    The images are written directly with OpenCV, without making matplotlib figures.
+
+    Parameters
+    ----------
+    results_table : pd.DataFrame
+        the table that is the output of dotblotr.process.process_dir()
+    image_directory : str
+        the path to the directory containing the strip images.
+        This is the same as used in process_dir() to generate the results_table
+    output_directory : str
+        the directory to write the QC images to. Created if it does not exist.
+        Each image is named <strip_id><output_extension>.
+    image_extension : str
+        The image extension for the strip images. Default value is '.tif'
+    output_extension : str
+        The image format of the QC images, e.g., '.png' or '.jpg'. Default value is '.png'
+    scale : float
+        The factor to resize the strip images by, e.g., 0.5 for half resolution.
+        The font size and line thickness are scaled to match. Default value is 1.
+    font_scale : float
+        The multiplier for setting the font size at full resolution.
+    font_color : Tuple[int, int, int]
+        RGB tuple for the font color. Default value is (255, 255, 255).
+    line_thickness : int
+        The line thickness is pixels at full resolution. Default value is 2.
+    n_workers : int
+        Number of worker processes to use. If 1, the images are written
+        serially in the current process. Default value is 1.
+
+    Returns
+    -------
+    output_paths : List[str]
+        The paths to the QC images that were written. Strips that
+        failed are reported with a warning and omitted.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    font_scale = font_scale * scale
+    line_thickness = max(1, int(round(line_thickness * scale)))
+
+    # the labels are the same for every strip, so the text sizes are only measured once
+    text_sizes = _text_sizes(results_table['dot_name'].unique(), font_scale, line_thickness)
+
+    strips = []
+    label_cols = ['dot_name', 'x', 'y']
+    for strip_id, strip_results in results_table.groupby('strip_id', sort=False, observed=True):
+        # long format results have a row per probe channel for each dot
+        strip_results = strip_results[label_cols].drop_duplicates('dot_name')
+        strip_args = (
+            path.join(image_directory, str(strip_id) + image_extension),
+            path.join(output_directory, str(strip_id) + output_extension),
+            strip_results['dot_name'].values,
+            strip_results['x'].values,
+            strip_results['y'].values,
+            text_sizes,
+            scale,
+            font_scale,
+            font_color,
+            line_thickness
         )
+        strips.append((strip_id, strip_args))
 
-    f, ax = plt.subplots(figsize=(15, 12))
-    ax.imshow(im)
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            errors = list(executor.map(_export_strip, *zip(*[args for _, args in strips])))
+    else:
+        errors = [_export_strip(*args) for _, args in strips]
 
-    return f, ax
+    output_paths = []
+    for (strip_id, strip_args), error in zip(strips, errors):
+        if error is not None:
+            warnings.warn('QC image for strip {} failed ({})'.format(strip_id, error))
+        else:
+            output_paths.append(strip_args[1])
+
+    return output_paths
@@ -17,8 +17,8 @@ def plot_hit_grid(
     ------------
     hit_table : pd.DataFrame
         the hit table output from calc_hit_counts().
-        Note that `calc_hit_counts()` returns an list of hit tables,
-        so index to the hit table you wish to plot.
+        Note that `calc_hit_counts()` returns the hit counts for all assays,
+        so select the rows for the assay you wish to plot.
     results_table : pd.DataFrame
         the results table output from process_dir() from which to get the strip info
     sort_by : list[str]
@@ -34,26 +34,20 @@ def plot_hit_grid(
         https://matplotlib.org/3.1.1/tutorials/colors/colormaps.html
     """
 
-    hit_table.sort_values(by=sort_by, axis=0, inplace=True, ascending=False)
+    # sort a copy so the caller's hit table is not modified
+    hit_table = hit_table.sort_values(by=sort_by, axis=0, ascending=False)
 
-    unique_strip_ids = results_table.strip_id.unique()
-    strip_ids = {strip_id: i for i, strip_id in enumerate(unique_strip_ids)}
+    # one point for each positive result of each dot, in the sorted dot order
+    hit_dots = hit_table[['dot_name', 'n_hits']].reset_index(drop=True)
+    hit_dots['hit_order'] = np.arange(len(hit_dots))
+    pos_results = results_table.loc[results_table['pos_hit'], ['dot_name', 'strip_id']].reset_index(drop=True)
+    pos_results['result_order'] = np.arange(len(pos_results))
+    points = hit_dots.merge(pos_results, on='dot_name', how='inner')
+    points = points.sort_values(['hit_order', 'result_order'], kind='stable')
 
-    names = []
-    strip_id_indices = []
-    counts = []
-
-    for i, row in hit_table.iterrows():
-        name = row['dot_name']
-        count = row['n_hits']
-        dot_table = results_table.loc[results_table['dot_name'] == name]
-
-        for j, dot_row in dot_table.iterrows():
-            if dot_row['pos_hit']:
-                #names.append(dot_row[x_label])
-                names.append(dot_row['dot_name'])
-                strip_id_indices.append(dot_row['strip_id'])
-                counts.append(count)
+    names = points['dot_name'].astype(object).values
+    strip_id_indices = points['strip_id'].astype(object).values
+    counts = points['n_hits'].values
 
     f, ax = plt.subplots(figsize=(50, 2))
     sc = ax.scatter(names, strip_id_indices, c=counts, cmap=cmap);
@@ -64,24 +58,19 @@ def plot_hit_grid(
 
     plt.draw()
 
+    # color each tick by the number of hits and label it with x_label
     norm = Normalize(vmin=1, vmax=hit_table['n_hits'].max())
-    # for t in ax.get_xticklabels():
-    #     tick_name = t.get_text()
-    #     dot_name = results_table.loc[results_table[x_label] == tick_name].dot_name.values[0]
-    #     n_hits = hit_table.loc[hit_table['dot_name'] == dot_name].n_hits.values[0]
-    #     c = sc.cmap(norm(n_hits))
-    #     t.set_color(c)
-    label_names = []
+    first_hits = hit_table.drop_duplicates('dot_name')
+    dot_n_hits = pd.Series(first_hits['n_hits'].values, index=first_hits['dot_name'].astype(str))
+    dot_labels = results_table.drop_duplicates('dot_name')
+    dot_labels = pd.Series(dot_labels[x_label].values, index=dot_labels['dot_name'].astype(str))
+
+    new_labels = []
     for t in ax.get_xticklabels():
         dot_name = t.get_text()
-        label_names.append(dot_name)
-        n_hits = hit_table.loc[hit_table['dot_name'] == dot_name].n_hits.values[0]
-        c = sc.cmap(norm(n_hits))
-        t.set_color(c)
-
-    new_labels = [
-        results_table.loc[results_table['dot_name'] == n][x_label].values[0] for n in label_names
-    ]
+        t.set_color(sc.cmap(norm(dot_n_hits[dot_name])))
+        new_labels.append(dot_labels[dot_name])
+
     ax.set_xticklabels(new_labels)
     plt.draw()
 
@@ -131,52 +120,42 @@ def plot_cplot(
         matplotlib axis object
     """
     # Get a list of unique genes in the results_table
-    unique_vertical_var = results_table[vertical_var].unique()
-
-    # sort the vertical variable by the number of instances
-    n_vert_var = [
-        len(
-            np.unique(
-                results_table.loc[
-                    (results_table[vertical_var] == v) & results_table['pos_hit']
-                ][horizontal_var]
-            )
-        )
-        for v in unique_vertical_var
-    ]
+    unique_vertical_var = pd.Index(results_table[vertical_var].unique().astype(object))
+
+    # sort the vertical variable by the number of horizontal values it is a hit in
+    pos_results = results_table.loc[results_table['pos_hit'], [vertical_var, horizontal_var]]
+    n_vert_var = pos_results.groupby(vertical_var, sort=False, observed=True)[horizontal_var].nunique()
+    n_vert_var = n_vert_var.reindex(unique_vertical_var, fill_value=0).values
 
     # optionally put the highest values closest to the horizontal axis
     if vert_sort_order == 'descending':
         vert_var_order = np.argsort(n_vert_var)[::-1]
+    elif vert_sort_order == 'ascending':
+        vert_var_order = np.argsort(n_vert_var)
+    else:
+        raise ValueError('vert_sort_order must be ascending or descending, got {}'.format(vert_sort_order))
     unique_vertical_var = unique_vertical_var[vert_var_order]
 
     # Get a list of the unique h_vars
-    unique_horizontal_variable = results_table[horizontal_var].unique()
-
-    # make an empty lists for the plot values for the dotplot
-    h_vars = []
-    v_vars = []
-    n_hits = []
-    color_property = []
-
-    for h in unique_horizontal_variable:
-        for v in unique_vertical_var:
-            # Get the rows where the strip_id and top_hit match the strip_id and
-            strip_gene_df = results_table[(results_table[horizontal_var] == h) & (results_table[vertical_var] == v)]
-
-            # If there are any matches, add the values to plot
-            if len(strip_gene_df) > 0:
-                # add the gene/strip pair to the coords
-                h_vars.append(h)
-                v_vars.append(v)
-
-                # each row of the df is a hit, so the number of rows is the number of hits
-                pos_rows = strip_gene_df.loc[strip_gene_df.pos_hit]
-                n_hits.append(len(pos_rows))
-
-                # I wasn't sure how you wanted to calculate the color_property,
-                # so I took the mean of the hits for the gene/strip pair
-                color_property.append(strip_gene_df[color_var].mean())
+    unique_horizontal_variable = pd.Index(results_table[horizontal_var].unique().astype(object))
+
+    # aggregate every (horizontal, vertical) pair in one pass. Each positive row is a hit.
+    # I wasn't sure how you wanted to calculate the color_property,
+    # so I took the mean of the hits for the gene/strip pair
+    pairs = results_table.groupby([horizontal_var, vertical_var], sort=False, observed=True).agg(
+        n_hits=('pos_hit', 'sum'),
+        color_property=(color_var, 'mean')
+    ).reset_index()
+
+    # order the points by horizontal value and then by the sorted vertical values
+    pairs['h_order'] = unique_horizontal_variable.get_indexer(pairs[horizontal_var].astype(object))
+    pairs['v_order'] = unique_vertical_var.get_indexer(pairs[vertical_var].astype(object))
+    pairs = pairs.sort_values(['h_order', 'v_order'])
+
+    h_vars = pairs[horizontal_var].astype(object).tolist()
+    v_vars = pairs[vertical_var].astype(object).tolist()
+    n_hits = pairs['n_hits'].tolist()
+    color_property = pairs['color_property'].tolist()
 
     # make the figure and axes
     f, ax = plt.subplots(figsize=(10, 15))
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from skimage import io
+
+from dotblotr.viz import export_qc_images
+
+
+def test_export_qc_images(tmp_path):
+    image_directory = tmp_path / 'images'
+    image_directory.mkdir()
+    for strip_id in ['strip_0', 'strip_1']:
+        im = np.zeros((100, 150, 3), dtype=np.uint8)
+        io.imsave(str(image_directory / (strip_id + '.tif')), im, check_contrast=False)
+
+    results_table = pd.DataFrame({
+        'strip_id': ['strip_0', 'strip_0', 'strip_1', 'strip_1', 'missing_strip', 'missing_strip'],
+        'dot_name': ['A1', 'A2'] * 3,
+        'x': [50, 100] * 3,
+        'y': [50, 50] * 3
+    })
+    output_directory = str(tmp_path / 'qc')
+
+    with pytest.warns(UserWarning, match='missing_strip'):
+        output_paths = export_qc_images(
+            results_table, str(image_directory), output_directory, scale=0.5, n_workers=2
+        )
+
+    assert output_paths == [
+        os.path.join(output_directory, 'strip_0.png'),
+        os.path.join(output_directory, 'strip_1.png')
+    ]
+    for output_path in output_paths:
+        qc_im = io.imread(output_path)
+        assert qc_im.shape == (50, 75, 3)
+        # the dot labels are drawn on the blank strip
+        assert qc_im.max() > 0